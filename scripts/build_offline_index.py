@@ -30,6 +30,10 @@ Usage:
     ./build_offline_index.py --repo-urls-from /etc/yum.repos.d/centos.repo \\
                              --output indexes/
 
+    # Build indexes for every *.repo file in a directory (requires network)
+    ./build_offline_index.py --repo-urls-from /etc/yum.repos.d/ \\
+                             --output indexes/
+
     # Build index from local DNF cache (NO network required!)
     ./build_offline_index.py --from-cache /var/cache/dnf \\
                              --output indexes/
@@ -43,42 +47,209 @@ Usage:
     ./build_offline_index.py --baseurl https://... --repo-id myrepo \\
                              --insecure --output index.json
 
-Output Format:
+Output Format (--format json, the default):
     {
+        "packages": [
+            "bash|0|5.1.8|6.el9|x86_64",
+            ...
+        ],
         "metadata": {
             "repo_id": "rhel-9-baseos",
             "source": "https://..." or "/var/cache/dnf/...",
             "generated": "2025-01-15T10:30:00",
+            "primary_checksum": "sha256:...",   (URL sources only)
             "package_count": 1234
-        },
-        "packages": {
-            "bash|0|5.1.8|6.el9|x86_64": "rhel-9-baseos",
-            ...
         }
     }
+
+    With --format msgpack the same metadata is stored alongside five
+    parallel arrays ("names", "epochs", "versions", "releases", "arches"),
+    one element per package, instead of the "packages" list.
+    
+    With --format sqlite the index is an SQLite database with a
+    "metadata" (key, value) table and a "packages" (name, epoch, version,
+    release, arch) table.
+    
+    With --format sorted-text the index is a .txt file: a "# " line with
+    the metadata as JSON, then one NEVRA key per line in byte order, so
+    the reader can binary-search it in place.
 """
 
+import io
 import os
-import re
 import sys
 import json
 import gzip
 import bz2
+import lzma
 import ssl
+import re
+import shutil
+import hashlib
+import pathlib
+import tempfile
 import argparse
-import xml.etree.ElementTree as ET
+import contextlib
+import itertools
+import collections
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
-from configparser import ConfigParser
+
+from thread_log import log, buffered_output
+
+# lxml is optional: its C-level iterparse is much faster than ElementTree
+# on large primary.xml files, but the standard library works everywhere.
+try:
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
+# orjson is optional: it serializes large indexes several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# isal is optional: its igzip reads gzip streams (primary.xml.gz, gzip
+# transfer encoding) several times faster than the zlib-based gzip module
+try:
+    from isal import igzip as gzip_reader
+except ImportError:
+    gzip_reader = gzip
+
+# zstandard is optional: enables the (smaller, faster to load) zstd output
+# and reading zstd-compressed primary metadata (primary.xml.zst)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# httpx is optional: when installed it is preferred over requests, and
+# with the h2 module repositories served over HTTPS share multiplexed
+# HTTP/2 connections
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+# requests is optional: when installed, one pooled session keeps HTTP
+# connections alive across requests (repomd.xml, primary, byte ranges)
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+# msgpack is optional: only needed for --format msgpack
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # Global SSL context (modified by --insecure flag)
 SSL_CONTEXT = None
 
-# XML namespaces used in repository metadata
-REPO_NS = {'repo': 'http://linux.duke.edu/metadata/repo'}
-COMMON_NS = {'common': 'http://linux.duke.edu/metadata/common'}
-RPM_NS = {'rpm': 'http://linux.duke.edu/metadata/rpm'}
+# User-Agent sent with every request
+USER_AGENT = 'offline-index-builder/1.0'
+
+# Transport compression we can decode (see decode_response)
+ACCEPT_ENCODING = 'gzip, zstd' if zstandard is not None else 'gzip'
+
+# Metadata files that carry their own compression. They are requested with
+# Accept-Encoding: identity and never transport-decoded: some servers label
+# .gz files "Content-Encoding: gzip", and decoding would strip the file's
+# own compression before open_decompressed() sees it.
+COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+
+# Maximum number of repositories downloaded concurrently
+MAX_DOWNLOAD_WORKERS = 8
+
+# Primary files larger than this are downloaded in parallel byte ranges
+# when a repository lists several mirrors
+SEGMENTED_DOWNLOAD_THRESHOLD = 8 * 1024 * 1024
+
+# Pooled HTTP session (see make_session), None when requests is unavailable
+SESSION = None
+
+# Build and download cache (see --cache-dir, None disables it):
+#  - <repo_id>.meta per repository built from a URL, used to skip
+#    repositories that did not change since the last run
+#  - <sha1(url)>.bin/.etag per primary metadata URL: the downloaded file
+#    and its ETag/Last-Modified, revalidated with a conditional GET
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'offline-index-builder')
+
+# Number of packages encoded per write when streaming JSON output
+JSON_CHUNK_SIZE = 8192
+
+# How primary metadata is parsed and where and how index files are
+# written (passed to the build workers)
+BuildOptions = collections.namedtuple(
+    'BuildOptions',
+    ['output', 'compress', 'compress_format', 'index_format', 'fast_regex'])
+
+# Index file suffix for each --format
+INDEX_FILE_SUFFIXES = {
+    'json': '.json',
+    'msgpack': '.msgpack',
+    'sqlite': '.sqlite',
+    'sorted-text': '.txt',
+}
+
+# --fast-regex: NEVRA fields of a <package> block as laid out by
+# createrepo. Entities ('&') are excluded, so such packages do not match
+# and the count check below falls back to the XML parser.
+FAST_PKG_RE = re.compile(
+    rb'<package type="rpm">\s*<name>([^<&]*)</name>\s*<arch>([^<&]*)</arch>'
+    rb'\s*<version epoch="([^"&]*)" ver="([^"&]*)" rel="([^"&]*)"/>')
+FAST_COUNT_RE = re.compile(rb'<metadata[^>]*\spackages="(\d+)"')
+
+# XML namespaces used in repository metadata, as Clark-notation prefixes
+# ("{namespace}tag") so tags can be compared and looked up directly
+REPO_NS = '{http://linux.duke.edu/metadata/repo}'
+COMMON_NS = '{http://linux.duke.edu/metadata/common}'
+
+# <package> tags in primary.xml and their <name>, <arch> and <version>
+# child tags (the bare forms are for non-namespaced metadata)
+PKG_CHILD_TAGS = {
+    f'{COMMON_NS}package': (f'{COMMON_NS}name', f'{COMMON_NS}arch', f'{COMMON_NS}version'),
+    'package': ('name', 'arch', 'version'),
+}
+PKG_TAGS = tuple(PKG_CHILD_TAGS)
+
+# Boolean option values that mean "off" in .repo files
+REPO_FALSE_VALUES = ('0', 'no', 'false', 'off')
+
+# A .repo section header; anything after the closing bracket (such as a
+# trailing comment) is ignored, as with ConfigParser's SECTCRE
+REPO_SECTION_RE = re.compile(r'\[(.+?)\]')
+
+# Lowercase hex digits used in DNF cache directory hash suffixes
+HEX_DIGITS = '0123456789abcdef'
+
+# Primary metadata file suffixes in order of preference, with their type
+PRIMARY_SUFFIXES = (
+    ('.sqlite.zst', 'sqlite'),
+    ('.sqlite.bz2', 'sqlite'),
+    ('.sqlite.gz', 'sqlite'),
+    ('.sqlite.xz', 'sqlite'),
+    ('.sqlite', 'sqlite'),
+    ('.xml.zst', 'xml'),
+    ('.xml.gz', 'xml'),
+    ('.xml.xz', 'xml'),
+    ('.xml.bz2', 'xml'),
+    ('.xml', 'xml'),
+)
 
 
 def parse_args():
@@ -94,6 +265,7 @@ Examples:
 
     # From a .repo config file (requires network):
     %(prog)s --repo-urls-from /etc/yum.repos.d/centos.repo --output indexes/
+    %(prog)s --repo-urls-from /etc/yum.repos.d/ --output indexes/
 
     # From local DNF cache (NO network required):
     %(prog)s --from-cache /var/cache/dnf --output indexes/
@@ -108,7 +280,8 @@ Examples:
     source_group.add_argument(
         '--repo-urls-from',
         metavar='REPO_FILE',
-        help='Parse .repo config file to extract URLs, then download (requires network)'
+        help='Parse .repo config file (or a directory of .repo files) to extract '
+             'URLs, then download (requires network)'
     )
     source_group.add_argument(
         '--from-cache',
@@ -125,10 +298,33 @@ Examples:
         required=True,
         help='Output file path (JSON) or directory'
     )
+    parser.add_argument(
+        '--format', '-f',
+        dest='index_format',
+        choices=list(INDEX_FILE_SUFFIXES),
+        default='json',
+        help='Index file format (default: json). msgpack stores the NEVRA '
+             'fields as parallel arrays: smaller and faster to load. sqlite '
+             'and sorted-text are queried in place by the reader, without '
+             'loading them; sorted-text is a plain, grep-able list of keys.'
+    )
+    parser.add_argument(
+        '--fast-regex',
+        action='store_true',
+        help='Extract packages from primary.xml with a regular expression '
+             'instead of an XML parser (faster, reads the whole file into '
+             'memory; falls back to the parser on unexpected layouts)'
+    )
     parser.add_argument(
         '--compress',
         action='store_true',
-        help='Compress output with gzip'
+        help='Compress output (see --compress-format)'
+    )
+    parser.add_argument(
+        '--compress-format',
+        choices=['gzip', 'zstd'],
+        help='Compression format for --compress (default: zstd if the '
+             'zstandard module is installed, otherwise gzip)'
     )
     parser.add_argument(
         '--verbose', '-v',
@@ -140,6 +336,18 @@ Examples:
         action='store_true',
         help='Disable SSL certificate verification (use with caution)'
     )
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        help='Directory for the build and download cache '
+             '(default: ~/.cache/offline-index-builder)'
+    )
+    parser.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Always download and rebuild, even if a repository is unchanged '
+             'since the last run'
+    )
     parser.add_argument(
         '--releasever',
         help='Value to substitute for $releasever in URLs (e.g., 9)'
@@ -152,25 +360,293 @@ Examples:
     return parser.parse_args()
 
 
-def download_file(url, verbose=False):
-    """Download a file and return its contents."""
-    if verbose:
-        print(f"    Downloading: {url}")
+def decode_response(response):
+    """
+    Wrap an HTTP response so reads return the body without transport
+    compression (the Content-Encoding requested via Accept-Encoding).
+    """
+    encoding = response.headers.get('Content-Encoding', '').strip().lower()
+    if encoding == 'gzip':
+        return gzip_reader.GzipFile(fileobj=response)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().stream_reader(response)
+    return response
+
+
+class DownloadError(Exception):
+    """An HTTP or connection error while fetching a URL."""
+
+
+class HttpxResponseReader(io.RawIOBase):
+    """
+    File-like view of a streaming httpx response body, with the `status`
+    and `headers` attributes of the urllib/urllib3 responses.
+    
+    Reads return the body as sent (no transport decoding), like the other
+    backends; see decode_response().
+    """
+    
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self._chunks = response.iter_raw()
+        self._pending = b''
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        while not self._pending:
+            self._pending = next(self._chunks, b'')
+            if not self._pending:
+                return 0
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+    
+    def close(self):
+        if not self.closed:
+            self.response.close()
+        super().close()
+
+
+def make_session(insecure=False):
+    """
+    Create the shared keep-alive HTTP client: an httpx client (HTTP/2
+    when h2 is installed) or a requests session. None without either.
+    """
+    if httpx is not None:
+        limits = httpx.Limits(max_connections=16, max_keepalive_connections=16)
+        return httpx.Client(http2=h2 is not None, verify=not insecure,
+                            headers={'User-Agent': USER_AGENT}, timeout=60,
+                            follow_redirects=True, limits=limits)
+    
+    if requests is None:
+        return None
     
-    req = Request(url, headers={'User-Agent': 'offline-index-builder/1.0'})
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    if insecure:
+        session.verify = False
+        import urllib3
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    return session
+
+
+def http_request(url, headers=None, method='GET'):
+    """
+    Send a request and return the streaming response (the caller must close
+    it). The response has `status`, `headers` and a file-like `read()`.
+    
+    Goes through the pooled SESSION (httpx or requests) when available,
+    otherwise urllib.
+    Raises DownloadError on HTTP and connection errors. A 304 Not Modified
+    (the answer to a conditional request) is returned like a success.
+    """
+    headers = {
+        'User-Agent': USER_AGENT,
+        'Accept-Encoding': ACCEPT_ENCODING,
+        **(headers or {}),
+    }
+    
+    if httpx is not None and isinstance(SESSION, httpx.Client):
+        try:
+            resp = SESSION.send(SESSION.build_request(method, url, headers=headers),
+                                stream=True)
+        except httpx.HTTPError as e:
+            raise DownloadError(f"URL Error: {e}") from e
+        if resp.status_code >= 400:
+            resp.close()
+            raise DownloadError(f"HTTP Error {resp.status_code}: {resp.reason_phrase}")
+        return HttpxResponseReader(resp)
+    
+    if SESSION is not None:
+        try:
+            resp = SESSION.request(method, url, headers=headers, stream=True,
+                                   timeout=60, allow_redirects=True)
+        except requests.RequestException as e:
+            raise DownloadError(f"URL Error: {e}") from e
+        if resp.status_code >= 400:
+            resp.close()
+            raise DownloadError(f"HTTP Error {resp.status_code}: {resp.reason}")
+        # The raw urllib3 response: undecoded body, back to the pool once read
+        return resp.raw
     
     try:
-        with urlopen(req, timeout=60, context=SSL_CONTEXT) as response:
-            content = response.read()
-            if verbose:
-                print(f"    Downloaded: {len(content)} bytes")
-            return content
+        return urlopen(Request(url, method=method, headers=headers),
+                       timeout=60, context=SSL_CONTEXT)
     except HTTPError as e:
-        print(f"    [!] HTTP Error {e.code}: {e.reason}")
-        return None
+        if e.code == 304:
+            return e
+        raise DownloadError(f"HTTP Error {e.code}: {e.reason}") from e
     except URLError as e:
-        print(f"    [!] URL Error: {e.reason}")
+        raise DownloadError(f"URL Error: {e.reason}") from e
+
+
+def open_url(url, verbose=False, headers=None, method='GET'):
+    """
+    Open a URL for streaming.
+    
+    `headers` are added to (or override) the default request headers.
+    
+    Returns the HTTP response (the caller must close it), or None on error.
+    """
+    if verbose:
+        log(f"    Downloading: {url}")
+    
+    try:
+        return http_request(url, headers, method)
+    except DownloadError as e:
+        log(f"    [!] {e}")
+        return None
+
+
+def conditional_headers(validators):
+    """Return If-None-Match / If-Modified-Since headers for saved validators."""
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def download_repomd(url, cached=None, verbose=False):
+    """
+    Download repomd.xml, revalidating the copy from a previous build.
+    
+    `cached` is the build cache entry for the repository (or None); its
+    ETag and Last-Modified values are sent as If-None-Match and
+    If-Modified-Since when it was fetched from the same URL.
+    
+    Returns a tuple (content, validators), where content is None if the
+    server answered 304 Not Modified. Returns None on error.
+    """
+    headers = {}
+    if cached and cached.get('repomd_url') == url:
+        headers = conditional_headers(cached)
+    
+    response = open_url(url, verbose, headers)
+    if response is None:
+        return None
+    
+    with response:
+        validators = {
+            'repomd_url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+        }
+        if response.status == 304:
+            return None, validators
+        content = decode_response(response).read()
+    
+    if verbose:
+        log(f"    Downloaded: {len(content)} bytes")
+    return content, validators
+
+
+def get_range_length(url):
+    """
+    Return the size of `url` if the server accepts byte range requests,
+    otherwise None.
+    """
+    response = open_url(url, headers={'Accept-Encoding': 'identity'}, method='HEAD')
+    if response is None:
+        return None
+    
+    with response:
+        response.read()  # drain, so a pooled connection can be reused
+        if 'bytes' not in response.headers.get('Accept-Ranges', ''):
+            return None
+        length = response.headers.get('Content-Length')
+        return int(length) if length and length.isdigit() else None
+
+
+def _download_range(urls, start, end):
+    """
+    Fetch bytes start..end (inclusive) from the first mirror that serves them.
+    
+    Runs in a worker thread, so it does not log. Returns bytes or None.
+    """
+    headers = {'Accept-Encoding': 'identity', 'Range': f'bytes={start}-{end}'}
+    for url in urls:
+        try:
+            with http_request(url, headers) as response:
+                if response.status != 206:
+                    continue
+                data = response.read()
+        except Exception:
+            # Any failure (HTTP, connection, truncated body): try the next mirror
+            continue
+        if len(data) == end - start + 1:
+            return data
+    return None
+
+
+def new_checksum_hasher(checksum):
+    """
+    Return a hashlib object for a repomd.xml checksum ("<type>:<hex>"), or
+    None if there is no checksum or hashlib does not know its type.
+    """
+    if not checksum:
+        return None
+    checksum_type = checksum.partition(':')[0]
+    try:
+        # Old createrepo releases write "sha" for SHA-1
+        return hashlib.new('sha1' if checksum_type == 'sha' else checksum_type)
+    except ValueError:
+        return None
+
+
+def download_segmented(urls, size, checksum, verbose=False):
+    """
+    Download a file of `size` bytes from several mirrors in parallel.
+    
+    The file is split into one byte range per mirror; a range that fails on
+    its mirror is retried on the others. The ranges come from different
+    mirrors, so the reassembled file is only used if it matches `checksum`
+    (the repomd.xml "<type>:<hex>" value): a mirror serving an older copy
+    would otherwise splice two versions into one file.
+    
+    Returns the reassembled content, or None if some range could not be
+    fetched from any mirror or the result does not match the checksum.
+    """
+    hasher = new_checksum_hasher(checksum)
+    if hasher is None:
+        log("    [!] No usable primary checksum to verify a segmented download, "
+            "using a single mirror")
+        return None
+    
+    segment = -(-size // len(urls))
+    ranges = [(start, min(start + segment, size) - 1) for start in range(0, size, segment)]
+    log(f"    Segmented download: {len(ranges)} ranges from {len(urls)} mirrors ({size} bytes)")
+    
+    def fetch(i):
+        # Range i starts on mirror i, then fails over to the others
+        return _download_range(urls[i:] + urls[:i], *ranges[i])
+    
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        parts = list(executor.map(fetch, range(len(ranges))))
+    
+    if any(part is None for part in parts):
+        log("    [!] Segmented download failed, falling back to a single mirror")
         return None
+    
+    data = b''.join(parts)
+    hasher.update(data)
+    if hasher.hexdigest() != checksum.partition(':')[2].lower():
+        log("    [!] Segmented download does not match the repomd.xml checksum "
+            "(mirrors out of sync?), falling back to a single mirror")
+        return None
+    
+    if verbose:
+        log(f"    Downloaded: {size} bytes")
+    return data
 
 
 def substitute_variables(url, releasever=None, basearch=None):
@@ -183,55 +659,194 @@ def substitute_variables(url, releasever=None, basearch=None):
 
 
 def parse_repomd(repomd_content):
-    """Parse repomd.xml and find the primary metadata location."""
-    root = ET.fromstring(repomd_content)
+    """
+    Parse repomd.xml and find the primary metadata location.
+    
+    `repomd_content` is the raw repomd.xml document (bytes).
+    
+    Returns a tuple: (primary_href, primary_checksum), or (None, None).
+    The checksum (e.g. "sha256:<hex>") is None if repomd.xml has none.
+    """
+    data_tag = f'{REPO_NS}data'
+    
+    source = io.BytesIO(repomd_content)
+    if HAVE_LXML:
+        # Only <data> elements are reported; as with primary.xml, never
+        # expand entities or fetch anything over the network
+        context = ET.iterparse(source, events=('end',), tag=data_tag,
+                               resolve_entities=False, no_network=True)
+    else:
+        context = ET.iterparse(source, events=('end',))
     
-    for data_elem in root.findall('repo:data', REPO_NS):
+    # Parse incrementally and stop at the primary entry; every <data>
+    # element is cleared once read
+    for _, data_elem in context:
+        if data_elem.tag != data_tag:
+            continue
+        
         if data_elem.get('type') == 'primary':
-            location = data_elem.find('repo:location', REPO_NS)
+            location = data_elem.find(f'{REPO_NS}location')
             if location is not None:
-                return location.get('href')
+                checksum = data_elem.find(f'{REPO_NS}checksum')
+                if checksum is not None and checksum.text:
+                    checksum = f"{checksum.get('type', '')}:{checksum.text.strip()}"
+                else:
+                    checksum = None
+                return location.get('href'), checksum
+        
+        data_elem.clear()
     
-    return None
+    return None, None
 
 
-def parse_primary_xml(primary_content, repo_id, verbose=False):
+def write_file_atomic(path, data):
+    """
+    Write `data` (bytes) to `path` through a uniquely named temporary file
+    in the same directory, so concurrent writers never share a file and
+    readers see either the old or the new content.
     """
-    Parse primary.xml and extract all package NEVRAs.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_cache_entry(repo_id):
+    """
+    Return the build cache entry for `repo_id`, or None.
     
-    Returns a dict: {nevra_key: repo_id}
+    The entry records what the last successful build used and produced:
+    the repomd.xml URL and its ETag/Last-Modified, the primary checksum,
+    the output path and the index metadata.
     """
-    packages = {}
+    if CACHE_DIR is None:
+        return None
     
-    if verbose:
-        print("    Parsing primary.xml...")
+    try:
+        with open(os.path.join(CACHE_DIR, f"{repo_id}.meta"), 'rb') as f:
+            return json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def save_cache_entry(repo_id, entry):
+    """Store the build cache entry for `repo_id` (see load_cache_entry)."""
+    if CACHE_DIR is None:
+        return
     
-    root = ET.fromstring(primary_content)
+    path = os.path.join(CACHE_DIR, f"{repo_id}.meta")
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        write_file_atomic(path, dump_json(entry))
+    except OSError as e:
+        log(f"    [!] Could not update build cache: {e}")
+
+
+def iter_package_elements(source):
+    """
+    Incrementally parse primary.xml and yield each <package> element.
     
-    # Handle namespaced XML
-    if root.tag.startswith('{'):
-        default_ns = root.tag.split('}')[0] + '}'
-        pkg_tag = f"{default_ns}package"
-        name_tag = f"{default_ns}name"
-        arch_tag = f"{default_ns}arch"
-        version_tag = f"{default_ns}version"
+    `source` is a filename or a binary file-like object. Each element is
+    cleared (and detached from its parent) once the caller moves on, so
+    only one package subtree is held in memory at a time.
+    """
+    if HAVE_LXML:
+        # primary.xml comes from a remote mirror: never expand entities or
+        # fetch anything over the network (the defusedxml defaults)
+        context = ET.iterparse(source, events=('end',), tag=PKG_TAGS,
+                               resolve_entities=False, no_network=True,
+                               huge_tree=False)
+        for _, elem in context:
+            yield elem
+            elem.clear()
+            # Drop already-processed siblings still referenced by <metadata>
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
     else:
-        pkg_tag = 'package'
-        name_tag = 'name'
-        arch_tag = 'arch'
-        version_tag = 'version'
+        context = ET.iterparse(source, events=('start', 'end'))
+        _, root = next(context)
+        for event, elem in context:
+            if event == 'end' and elem.tag in PKG_TAGS:
+                yield elem
+                elem.clear()
+                del root[:]
+
+
+def parse_primary_xml_regex(source, verbose=False):
+    """
+    Extract NEVRA keys from primary.xml with FAST_PKG_RE, without an XML
+    parser (--fast-regex).
     
-    count = 0
-    for pkg_elem in root.iter(pkg_tag):
+    The whole (decompressed) file is read into memory. If the number of
+    matches differs from the number of <package type="rpm"> blocks, or
+    the document holds fewer packages than its <metadata packages="N">
+    count, it is parsed with the XML parser instead.
+    
+    Yields strings: "name|epoch|version|release|arch"
+    """
+    if verbose:
+        log("    Scanning primary.xml (--fast-regex)...")
+    
+    data = source.read()
+    keys = [
+        (b'%s|%s|%s|%s|%s' % (name, epoch, version, release, arch)).decode('utf-8')
+        for name, arch, epoch, version, release in FAST_PKG_RE.findall(data)
+    ]
+    
+    declared = FAST_COUNT_RE.search(data, 0, 4096)
+    if (len(keys) != data.count(b'<package type="rpm"')
+            or (declared and data.count(b'<package ') < int(declared.group(1)))):
+        log("    Unexpected primary.xml layout, using the XML parser")
+        yield from parse_primary_xml(io.BytesIO(data), verbose)
+        return
+    
+    yield from keys
+
+
+def parse_primary_xml(source, verbose=False):
+    """
+    Parse primary.xml and yield the NEVRA key of every package.
+    
+    `source` is a filename or a binary file-like object with the
+    (decompressed) primary.xml content. Keys are produced as the document
+    is read, so they can be written out without building a mapping first.
+    
+    Yields strings: "name|epoch|version|release|arch"
+    """
+    if verbose:
+        log("    Parsing primary.xml...")
+    
+    name_tag = arch_tag = version_tag = None
+    
+    for pkg_elem in iter_package_elements(source):
         if pkg_elem.get('type') != 'rpm':
             continue
         
-        name_elem = pkg_elem.find(name_tag)
-        arch_elem = pkg_elem.find(arch_tag)
-        version_elem = pkg_elem.find(version_tag)
+        # Child tags share the <package> namespace
+        if name_tag is None:
+            name_tag, arch_tag, version_tag = PKG_CHILD_TAGS[pkg_elem.tag]
         
-        if name_elem is None or arch_elem is None or version_elem is None:
-            continue
+        # createrepo always writes <name>, <arch>, <version> as the first
+        # three children: index them directly (much cheaper than find() on
+        # lxml) and only search when the layout differs
+        try:
+            name_elem, arch_elem, version_elem = pkg_elem[0], pkg_elem[1], pkg_elem[2]
+        except IndexError:
+            name_elem = None
+        
+        if (name_elem is None or name_elem.tag != name_tag
+                or arch_elem.tag != arch_tag or version_elem.tag != version_tag):
+            name_elem = pkg_elem.find(name_tag)
+            arch_elem = pkg_elem.find(arch_tag)
+            version_elem = pkg_elem.find(version_tag)
+            
+            if name_elem is None or arch_elem is None or version_elem is None:
+                continue
         
         name = name_elem.text
         arch = arch_elem.text
@@ -240,42 +855,51 @@ def parse_primary_xml(primary_content, repo_id, verbose=False):
         release = version_elem.get('rel', '')
         
         # Create the NEVRA key: name|epoch|version|release|arch
-        nevra_key = f"{name}|{epoch}|{version}|{release}|{arch}"
-        
-        packages[nevra_key] = repo_id
-        count += 1
-        
-        if verbose and count % 1000 == 0:
-            print(f"    Processed {count} packages...")
-    
-    if verbose:
-        print(f"    Total packages found: {count}")
-    
-    return packages
+        # (a single f-string beats '|'.join() of a tuple on CPython)
+        yield f"{name}|{epoch}|{version}|{release}|{arch}"
 
 
-def decompress_file(filepath, content=None):
-    """Decompress a file based on its extension. Returns decompressed content."""
-    if content is None:
-        with open(filepath, 'rb') as f:
-            content = f.read()
+def open_decompressed(source, filename=None):
+    """
+    Open a (possibly compressed) metadata file as a streaming binary reader.
     
-    if filepath.endswith('.gz'):
-        return gzip.decompress(content)
-    elif filepath.endswith('.bz2'):
-        return bz2.decompress(content)
-    elif filepath.endswith('.xz'):
-        import lzma
-        return lzma.decompress(content)
+    `source` is a file path, the raw downloaded bytes, or a binary file-like
+    object. The decompressor is chosen from the extension of `filename`
+    (defaults to `source` when it is a path). Data is decoded incrementally
+    as the caller reads, so no fully decompressed buffer is materialized.
+    """
+    if filename is None:
+        filename = source
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    
+    if filename.endswith('.gz'):
+        return gzip_reader.open(source, 'rb')
+    elif filename.endswith('.bz2'):
+        return bz2.open(source, 'rb')
+    elif filename.endswith('.xz'):
+        return lzma.open(source, 'rb')
+    elif filename.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError(f"{os.path.basename(filename)} is zstd-compressed "
+                               "and the zstandard module is not installed")
+        if isinstance(source, str):
+            source = open(source, 'rb')
+        return zstandard.ZstdDecompressor().stream_reader(source, read_across_frames=True)
+    elif isinstance(source, str):
+        return open(source, 'rb')
     else:
-        return content
+        return source
 
 
 def find_primary_files(cache_dir, verbose=False):
     """
-    Scan a directory tree for primary.xml.gz or primary.sqlite.bz2 files.
+    Scan a directory tree for primary.sqlite.* or primary.xml.* files.
+    
+    When a repodata directory has both, the sqlite database is preferred:
+    querying it is much cheaper than tokenizing the XML.
     
-    Returns a list of tuples: (repo_id, primary_file_path)
+    Returns a list of tuples: (repo_id, primary_file_path, file_type)
     """
     found = []
     
@@ -293,84 +917,141 @@ def find_primary_files(cache_dir, verbose=False):
             
             # Extract repo_id by removing the hash suffix
             # Pattern: repo-id-<16 hex chars>
-            match = re.match(r'^(.+)-[a-f0-9]{16}$', parent_dir)
-            if match:
-                repo_id = match.group(1)
+            head, sep, tail = parent_dir.rpartition('-')
+            if head and len(tail) == 16 and not tail.strip(HEX_DIGITS):
+                repo_id = head
             else:
                 repo_id = parent_dir
             
-            # Look for primary metadata files
-            for filename in os.listdir(repodata_path):
+            # Collect primary metadata candidates by suffix
+            candidates = {}
+            with os.scandir(repodata_path) as entries:
+                filenames = [e.name for e in entries if e.is_file()]
+            for filename in filenames:
                 if 'primary' in filename:
-                    if filename.endswith(('.xml.gz', '.xml.xz', '.xml.bz2', '.xml')):
-                        primary_path = os.path.join(repodata_path, filename)
-                        found.append((repo_id, primary_path, 'xml'))
-                        if verbose:
-                            print(f"    Found: {repo_id} -> {primary_path}")
-                        break
-                    elif filename.endswith('.sqlite.bz2') or filename.endswith('.sqlite.gz'):
-                        primary_path = os.path.join(repodata_path, filename)
-                        found.append((repo_id, primary_path, 'sqlite'))
-                        if verbose:
-                            print(f"    Found (sqlite): {repo_id} -> {primary_path}")
-                        break
+                    for suffix, _ in PRIMARY_SUFFIXES:
+                        if filename.endswith(suffix):
+                            candidates.setdefault(suffix, filename)
+                            break
+            
+            # Pick the best candidate in priority order (zstd files last
+            # when they cannot be decompressed here)
+            order = PRIMARY_SUFFIXES
+            if zstandard is None:
+                order = sorted(order, key=lambda item: item[0].endswith('.zst'))
+            for suffix, file_type in order:
+                if suffix in candidates:
+                    primary_path = os.path.join(repodata_path, candidates[suffix])
+                    found.append((repo_id, primary_path, file_type))
+                    if verbose:
+                        print(f"    Found ({file_type}): {repo_id} -> {primary_path}")
+                    break
     
     return found
 
 
-def parse_primary_sqlite(db_content, repo_id, verbose=False):
+def _query_primary_sqlite(conn):
+    """Yield NEVRA keys from an open primary.sqlite connection."""
+    cursor = conn.execute("SELECT name, epoch, version, release, arch FROM packages")
+    for name, epoch, version, release, arch in cursor:
+        yield f"{name}|{epoch or '0'}|{version}|{release}|{arch}"
+
+
+def parse_primary_sqlite(db_stream, verbose=False):
     """
-    Parse primary.sqlite and extract all package NEVRAs.
+    Parse primary.sqlite and yield the NEVRA key of every package.
     
-    Returns a dict: {nevra_key: repo_id}
+    `db_stream` is a binary file-like object with the (decompressed)
+    database content. Rows are read from the cursor as they are consumed.
+    
+    Yields strings: "name|epoch|version|release|arch"
     """
     import sqlite3
-    import tempfile
-    
-    packages = {}
     
     if verbose:
-        print("    Parsing primary.sqlite...")
+        log("    Parsing primary.sqlite...")
+    
+    # Fast path (Python 3.11+): load the database straight into memory
+    if hasattr(sqlite3.Connection, 'deserialize'):
+        conn = sqlite3.connect(':memory:')
+        try:
+            conn.deserialize(db_stream.read())
+            yield from _query_primary_sqlite(conn)
+        finally:
+            conn.close()
+        return
     
-    # Write to temp file (sqlite3 requires a file)
+    # Write to temp file (older sqlite3 modules require a file)
     with tempfile.NamedTemporaryFile(delete=False, suffix='.sqlite') as tmp:
-        tmp.write(db_content)
+        shutil.copyfileobj(db_stream, tmp, 1 << 20)
         tmp_path = tmp.name
     
     try:
-        conn = sqlite3.connect(tmp_path)
-        cursor = conn.cursor()
+        # Read-only and immutable: no locking or journal work for a
+        # database that is queried once
+        uri = pathlib.Path(tmp_path).as_uri() + '?mode=ro&immutable=1'
+        conn = sqlite3.connect(uri, uri=True)
         
         # Query all packages
-        cursor.execute("SELECT name, epoch, version, release, arch FROM packages")
-        
-        count = 0
-        for row in cursor:
-            name, epoch, version, release, arch = row
-            epoch = epoch if epoch else '0'
-            
-            nevra_key = f"{name}|{epoch}|{version}|{release}|{arch}"
-            packages[nevra_key] = repo_id
-            count += 1
-        
-        conn.close()
-        
-        if verbose:
-            print(f"    Total packages found: {count}")
+        try:
+            yield from _query_primary_sqlite(conn)
+        finally:
+            conn.close()
     
     finally:
         os.unlink(tmp_path)
+
+
+def output_path_for(options, repo_id):
+    """Return the index file path for `repo_id` (before compression suffixes)."""
+    if os.path.isdir(options.output):
+        return os.path.join(options.output,
+                            repo_id + INDEX_FILE_SUFFIXES[options.index_format])
+    return options.output
+
+
+def _build_one(entry, options, verbose=False):
+    """
+    Build and write the index for a single cached repository.
+    
+    Runs in a worker process, so it must stay a picklable top-level function.
+    `entry` is a (repo_id, primary_path, file_type) tuple from
+    find_primary_files().
+    
+    Returns a tuple: (final_path, metadata)
+    """
+    repo_id, primary_path, file_type = entry
+    
+    metadata = {
+        "repo_id": repo_id,
+        "source": primary_path,
+        "generated": datetime.utcnow().isoformat(),
+    }
     
-    return packages
+    # Decompress and parse based on file type
+    with open_decompressed(primary_path) as stream:
+        if file_type == 'xml' and options.fast_regex:
+            nevra_keys = parse_primary_xml_regex(stream, verbose)
+        elif file_type == 'xml':
+            nevra_keys = parse_primary_xml(stream, verbose)
+        else:  # sqlite
+            nevra_keys = parse_primary_sqlite(stream, verbose)
+        
+        return write_index(nevra_keys, metadata, output_path_for(options, repo_id),
+                           options)
 
 
-def build_index_from_cache(cache_dir, verbose=False):
+def build_index_from_cache(cache_dir, options, verbose=False):
     """
     Build indexes from a local cache directory (e.g., /var/cache/dnf).
     
-    Returns a list of index dicts.
+    Repositories are independent, so they are decompressed and parsed in
+    parallel worker processes (one per CPU, at most one per repository).
+    Each worker writes its own index file.
+    
+    Returns a list of (final_path, metadata) tuples.
     """
-    indexes = []
+    results = []
     
     primary_files = find_primary_files(cache_dir, verbose)
     
@@ -382,133 +1063,690 @@ def build_index_from_cache(cache_dir, verbose=False):
     
     print(f"[*] Found {len(primary_files)} repository metadata files")
     
-    for repo_id, primary_path, file_type in primary_files:
-        print(f"\n[*] Building index for: {repo_id}")
-        print(f"    Source: {primary_path}")
+    if len(primary_files) > 1 and not os.path.isdir(options.output):
+        print("[!] Several repositories found, --output must be a directory")
+        return []
+    
+    max_workers = min(os.cpu_count() or 1, len(primary_files))
+    print(f"[*] Decompressing and parsing with {max_workers} worker process(es)...")
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_build_one, entry, options, verbose): i
+            for i, entry in enumerate(primary_files)
+        }
         
-        try:
-            # Read and decompress
-            print("    Decompressing...")
-            primary_content = decompress_file(primary_path)
-            
-            # Parse based on file type
-            print("    Parsing package list...")
-            if file_type == 'xml':
-                packages = parse_primary_xml(primary_content, repo_id, verbose)
-            else:  # sqlite
-                packages = parse_primary_sqlite(primary_content, repo_id, verbose)
-            
-            index = {
-                "metadata": {
-                    "repo_id": repo_id,
-                    "source": primary_path,
-                    "generated": datetime.utcnow().isoformat(),
-                    "package_count": len(packages)
-                },
-                "packages": packages
-            }
+        # Report each repo as soon as it is done; a failing repo does not
+        # stop the others
+        for future in as_completed(futures):
+            i = futures[future]
+            repo_id, primary_path, _ = primary_files[i]
+            print(f"\n[*] Building index for: {repo_id}")
+            print(f"    Source: {primary_path}")
             
-            indexes.append(index)
-            print(f"    Packages indexed: {len(packages)}")
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[!] Error processing {repo_id}: {e}")
+                continue
             
-        except Exception as e:
-            print(f"[!] Error processing {repo_id}: {e}")
-            continue
+            results.append((i, result))
+            print(f"    Packages indexed: {result[1]['package_count']}")
     
-    return indexes
+    # Final summary in discovery order
+    return [result for _, result in sorted(results)]
 
 
-def build_index_from_url(baseurl, repo_id, verbose=False):
+def primary_cache_paths(url):
+    """Return the (body, validators) download cache paths for `url`."""
+    name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return (os.path.join(CACHE_DIR, f"{name}.bin"),
+            os.path.join(CACHE_DIR, f"{name}.etag"))
+
+
+def forget_cached_primary(url):
+    """Remove the download cache files for `url`, if any."""
+    for path in primary_cache_paths(url):
+        with contextlib.suppress(OSError):
+            os.unlink(path)
+
+
+class CachingReader:
+    """Pass reads through from `stream`, copying the data to `sink`."""
+    
+    def __init__(self, stream, sink):
+        self.stream = stream
+        self.sink = sink
+    
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.sink.write(data)
+        return data
+    
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _cache_primary_download(stack, source, url, response):
+    """
+    Copy the primary metadata to the download cache while it is parsed.
+    
+    The copy only replaces the cached file if the `stack` closes without
+    an error; returns the reader to parse from.
+    """
+    body_path, validators_path = primary_cache_paths(url)
+    validators = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    if not validators['etag'] and not validators['last_modified']:
+        # Could never be revalidated
+        return source
+    
+    # Builds running in parallel may fetch the same primary URL (repos
+    # sharing a mirror), so every writer gets its own temporary file
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.part')
+        sink = os.fdopen(fd, 'wb')
+    except OSError as e:
+        log(f"    [!] Could not write download cache: {e}")
+        return source
+    
+    reader = CachingReader(source, sink)
+    
+    def finish(exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                # The parser may stop before the end of the compressed file
+                while reader.read(1 << 20):
+                    pass
+                sink.close()
+                # Drop the old validators first: they must never describe
+                # a body other than the one next to them
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(validators_path)
+                os.replace(tmp_path, body_path)
+                write_file_atomic(validators_path, dump_json(validators))
+        except OSError as e:
+            log(f"    [!] Could not write download cache: {e}")
+        finally:
+            sink.close()
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+        return False
+    
+    stack.push(finish)
+    return reader
+
+
+def open_primary_source(primary_urls, stack, checksum=None, verbose=False):
     """
-    Build a NEVRA index from a repository URL.
+    Open the primary metadata file from the first mirror that answers.
+    
+    Large files are downloaded in byte ranges spread across the mirrors
+    when the result can be verified against `checksum`, the primary
+    checksum from repomd.xml ("<type>:<hex>").
+    With the download cache enabled, a cached copy from a previous run is
+    revalidated with a conditional GET and reused on 304 Not Modified,
+    and new downloads are copied to the cache while they are parsed.
+    
+    Returns a tuple (source, url): a binary file-like object with the
+    (still compressed) file, registered on `stack`, and the URL it came
+    from. Returns (None, None) on failure.
     """
-    print(f"\n[*] Building index for: {repo_id}")
-    print(f"    Base URL: {baseurl}")
+    compressed = primary_urls[0].endswith(COMPRESSED_SUFFIXES)
+    encoding_headers = {'Accept-Encoding': 'identity'} if compressed else {}
     
-    baseurl = baseurl.rstrip('/')
+    response = None
+    if CACHE_DIR is not None:
+        body_path, validators_path = primary_cache_paths(primary_urls[0])
+        try:
+            with open(validators_path, 'rb') as f:
+                cached = json.loads(f.read())
+        except (OSError, ValueError):
+            cached = None
+        
+        if cached is not None and os.path.exists(body_path):
+            response = open_url(primary_urls[0], verbose,
+                                {**conditional_headers(cached), **encoding_headers})
+            if response is not None and response.status == 304:
+                response.close()
+                log("    Not modified, using the cached download")
+                return stack.enter_context(open(body_path, 'rb')), primary_urls[0]
     
-    # Step 1: Download repomd.xml
-    print("\n[*] Step 1: Downloading repomd.xml...")
-    repomd_url = f"{baseurl}/repodata/repomd.xml"
-    repomd_content = download_file(repomd_url, verbose)
+    # With several mirrors, split large files into parallel byte ranges
+    if response is None and len(primary_urls) > 1:
+        size = get_range_length(primary_urls[0])
+        if size and size > SEGMENTED_DOWNLOAD_THRESHOLD:
+            data = download_segmented(primary_urls, size, checksum, verbose)
+            if data is not None:
+                return io.BytesIO(data), primary_urls[0]
     
-    if not repomd_content:
-        print("[!] Failed to download repomd.xml")
+    url = primary_urls[0]
+    if response is None:
+        for url in primary_urls:
+            response = open_url(url, verbose, encoding_headers)
+            if response is not None:
+                break
+        else:
+            return None, None
+    
+    source = stack.enter_context(response)
+    if not compressed:
+        source = decode_response(source)
+    if CACHE_DIR is not None:
+        source = _cache_primary_download(stack, source, url, response)
+    return source, url
+
+
+def build_index_from_url(baseurls, repo_id, options, verbose=False):
+    """
+    Build a NEVRA index from a repository URL and write it to disk.
+    
+    `baseurls` is a URL or a list of mirror URLs of the same repository.
+    repomd.xml and the primary metadata are fetched from the first mirror
+    that answers; large primary files are downloaded in byte ranges spread
+    across all mirrors.
+    
+    If the repository is unchanged since the last build into the same
+    output file (repomd.xml answers 304, or the primary checksum matches
+    the build cache or the existing index's metadata), nothing is
+    downloaded or parsed and the existing index is kept.
+    
+    Returns a tuple (final_path, metadata), or None on failure.
+    """
+    if isinstance(baseurls, str):
+        baseurls = [baseurls]
+    baseurls = [url.rstrip('/') for url in baseurls]
+    
+    log(f"\n[*] Building index for: {repo_id}")
+    log(f"    Base URL: {baseurls[0]}")
+    for mirror in baseurls[1:]:
+        log(f"    Mirror: {mirror}")
+    
+    output_path = final_output_path(output_path_for(options, repo_id), options)
+    
+    # A previous build only counts if it wrote the file we would write now
+    previous = cached = load_cache_entry(repo_id)
+    if cached and (cached.get('output_path') != os.path.abspath(output_path)
+                   or not os.path.exists(output_path)):
+        cached = None
+    
+    # Step 1: Download repomd.xml (failing over between mirrors)
+    log("\n[*] Step 1: Downloading repomd.xml...")
+    result = None
+    for i, baseurl in enumerate(baseurls):
+        result = download_repomd(f"{baseurl}/repodata/repomd.xml", cached, verbose)
+        if result:
+            # Keep using the mirror that answered first
+            baseurls = baseurls[i:] + baseurls[:i]
+            break
+    
+    if not result:
+        log("[!] Failed to download repomd.xml")
         return None
     
+    repomd_content, validators = result
+    baseurl = baseurls[0]
+    
+    if repomd_content is None:
+        log(f"    repomd.xml not modified, keeping {output_path}")
+        return output_path, cached['metadata']
+    
     # Step 2: Parse repomd.xml
-    print("\n[*] Step 2: Parsing repomd.xml...")
-    primary_location = parse_repomd(repomd_content)
+    log("\n[*] Step 2: Parsing repomd.xml...")
+    primary_location, primary_checksum = parse_repomd(repomd_content)
     
     if not primary_location:
-        print("[!] Could not find primary metadata in repomd.xml")
+        log("[!] Could not find primary metadata in repomd.xml")
         return None
     
-    print(f"    Primary metadata: {primary_location}")
+    log(f"    Primary metadata: {primary_location}")
     
-    # Step 3: Download primary metadata
-    print("\n[*] Step 3: Downloading primary metadata...")
-    primary_url = f"{baseurl}/{primary_location}"
-    primary_compressed = download_file(primary_url, verbose)
-    
-    if not primary_compressed:
-        print("[!] Failed to download primary metadata")
+    if primary_location.endswith('.zst') and zstandard is None:
+        log("[!] Primary metadata is zstd-compressed, which requires the zstandard module")
+        log("    Install python3-zstandard")
         return None
     
-    # Step 4: Decompress
-    print("\n[*] Step 4: Decompressing metadata...")
-    primary_content = decompress_file(primary_location, primary_compressed)
+    if cached and primary_checksum and cached.get('checksum') == primary_checksum:
+        log(f"    Primary metadata unchanged, keeping {output_path}")
+        save_cache_entry(repo_id, dict(cached, **validators))
+        return output_path, cached['metadata']
     
-    # Step 5: Parse
-    print("\n[*] Step 5: Parsing package list...")
-    packages = parse_primary_xml(primary_content, repo_id, verbose)
+    # Without a build cache entry (the cache was cleared, or the index was
+    # built elsewhere) the existing index still records the checksum it
+    # was built from. --no-cache always rebuilds.
+    if (not cached and CACHE_DIR is not None and primary_checksum
+            and os.path.exists(output_path)):
+        existing = read_index_metadata(output_path, options)
+        if existing and existing.get('primary_checksum') == primary_checksum:
+            log(f"    Primary metadata unchanged, keeping {output_path}")
+            save_cache_entry(repo_id, dict(validators, checksum=primary_checksum,
+                                           primary_url=(previous or {}).get('primary_url'),
+                                           output_path=os.path.abspath(output_path),
+                                           metadata=existing))
+            return output_path, existing
     
-    index = {
-        "metadata": {
+    # Step 3: Download, decompress and parse primary metadata in one pass
+    # (HTTP response -> decompressor -> iterparse, nothing fully buffered)
+    log("\n[*] Step 3: Downloading and parsing primary metadata...")
+    primary_urls = [f"{url}/{primary_location}" for url in baseurls]
+    
+    with contextlib.ExitStack() as stack:
+        source, primary_url = open_primary_source(primary_urls, stack,
+                                                  primary_checksum, verbose)
+        if source is None:
+            log("[!] Failed to download primary metadata")
+            return None
+        
+        metadata = {
             "repo_id": repo_id,
             "source": baseurl,
             "generated": datetime.utcnow().isoformat(),
-            "package_count": len(packages)
-        },
-        "packages": packages
-    }
+            "primary_checksum": primary_checksum,
+        }
+        
+        stream = stack.enter_context(open_decompressed(source, primary_location))
+        if options.fast_regex:
+            nevra_keys = parse_primary_xml_regex(stream, verbose)
+        else:
+            nevra_keys = parse_primary_xml(stream, verbose)
+        final_path, metadata = write_index(nevra_keys, metadata, output_path, options)
+    
+    log(f"    Packages indexed: {metadata['package_count']}")
+    
+    # The previous primary file is outdated once the repository changed
+    if previous and previous.get('primary_url') not in (None, primary_url):
+        forget_cached_primary(previous['primary_url'])
+    
+    save_cache_entry(repo_id, dict(validators, checksum=primary_checksum,
+                                   primary_url=primary_url,
+                                   output_path=os.path.abspath(final_path),
+                                   metadata=metadata))
     
-    return index
+    return final_path, metadata
+
+
+def _build_from_url_buffered(baseurls, repo_id, options, verbose=False):
+    """
+    Run build_index_from_url() with its output captured.
+    
+    Returns a tuple: (result or None, captured output)
+    """
+    with buffered_output() as output:
+        try:
+            result = build_index_from_url(baseurls, repo_id, options, verbose)
+        except Exception as e:
+            log(f"[!] Error processing {repo_id}: {e}")
+            result = None
+        return result, output.getvalue()
+
+
+def build_indexes_from_urls(repos, options, verbose=False):
+    """
+    Build indexes for several repositories concurrently.
+    
+    `repos` is a list of (repo_id, baseurls) tuples, where `baseurls` is a
+    list of mirror URLs. Downloads are I/O-bound,
+    so threads are used. Each repository's output is buffered and printed
+    as a whole as soon as it completes, so logs never interleave.
+    
+    Returns a list of (final_path, metadata) tuples, in `repos` order.
+    """
+    results = []
+    
+    max_workers = min(MAX_DOWNLOAD_WORKERS, len(repos))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_build_from_url_buffered, baseurls, repo_id, options, verbose): i
+            for i, (repo_id, baseurls) in enumerate(repos)
+        }
+        for future in as_completed(futures):
+            result, output = future.result()
+            print(output, end='')
+            if result:
+                results.append((futures[future], result))
+    
+    return [result for _, result in sorted(results)]
+
+
+def find_repo_files(path):
+    """
+    Return the .repo files to read for `path`.
+    
+    `path` is either a single .repo file or a directory such as
+    /etc/yum.repos.d, in which case its *.repo files are returned sorted.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    
+    with os.scandir(path) as entries:
+        return sorted(e.path for e in entries
+                      if e.name.endswith('.repo') and e.is_file())
 
 
 def parse_repo_file(repo_file_path):
-    """Parse a .repo file and extract repository definitions."""
-    config = ConfigParser()
-    config.read(repo_file_path)
+    """
+    Parse a .repo file (or a directory of them) and extract repository
+    definitions.
+    
+    Only `baseurl` and `enabled` are needed, so the files are read with a
+    line scanner instead of ConfigParser: "[section]" headers, "key=value"
+    options, indented continuation lines (multi-line baseurl), and "#" or
+    ";" comments. Values are taken literally (no "%" interpolation), as
+    DNF does.
     
+    Returns a dict: {repo_id: [baseurl, ...]} (all mirrors listed in baseurl)
+    """
     repos = {}
-    for section in config.sections():
-        baseurl = config.get(section, 'baseurl', fallback=None)
-        enabled = config.getboolean(section, 'enabled', fallback=True)
+    for path in find_repo_files(repo_file_path):
+        with open(path, encoding='utf-8', errors='replace') as f:
+            content = f.read()
+        
+        # Files that only use metalink/mirrorlist have nothing to build from
+        if 'baseurl' not in content:
+            continue
         
-        if baseurl and enabled:
-            urls = baseurl.strip().split('\n')
-            repos[section] = urls[0].strip()
+        sections = {}
+        options = key = None
+        for line in content.splitlines():
+            stripped = line.strip()
+            if not stripped:
+                key = None
+                continue
+            if stripped[0] in '#;':
+                continue
+            
+            if line[0] in ' \t' and key is not None:
+                # Continuation of the previous option's value
+                options[key] += '\n' + stripped
+                continue
+            
+            header = REPO_SECTION_RE.match(stripped)
+            if header is not None:
+                options = sections.setdefault(header.group(1).strip(), {})
+                key = None
+            else:
+                name, sep, value = stripped.partition('=')
+                key = name.strip().lower() if sep and options is not None else None
+                if key is not None:
+                    options[key] = value.strip()
+        
+        for section, options in sections.items():
+            baseurl = options.get('baseurl')
+            enabled = options.get('enabled', '1').lower() not in REPO_FALSE_VALUES
+            
+            if baseurl and enabled:
+                # baseurl may list several mirrors, separated by whitespace or commas
+                repos[section] = baseurl.replace(',', ' ').split()
     
     return repos
 
 
-def save_index(index, output_path, compress=False):
-    """Save the index to a JSON file."""
-    if compress:
-        if not output_path.endswith('.gz'):
-            output_path += '.gz'
-        with gzip.open(output_path, 'wt', encoding='utf-8') as f:
-            json.dump(index, f, separators=(',', ':'))
+def dump_json(obj, indent=False):
+    """Serialize to UTF-8 JSON bytes, using orjson when available."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2).encode('utf-8')
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def pack_index_soa(nevra_keys, metadata):
+    """
+    Serialize an index to MessagePack in struct-of-arrays form.
+    
+    Instead of one "name|epoch|version|release|arch" -> repo_id entry per
+    package, the five NEVRA fields are stored as parallel arrays; the
+    repository is given once in the metadata.
+    """
+    if nevra_keys:
+        columns = [list(c) for c in zip(*(key.split('|') for key in nevra_keys))]
     else:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(index, f, indent=2)
+        columns = [[], [], [], [], []]
+    
+    names, epochs, versions, releases, arches = columns
+    return msgpack.packb({
+        "metadata": metadata,
+        "names": names,
+        "epochs": epochs,
+        "versions": versions,
+        "releases": releases,
+        "arches": arches,
+    })
+
+
+def write_json_index(f, nevra_keys, metadata, indent=False):
+    """
+    Stream a JSON index to the binary file `f`.
+    
+    "packages" is a list of NEVRA keys; they all belong to the repository
+    named in the metadata, so the repo id is not repeated per package.
+    Keys are encoded JSON_CHUNK_SIZE at a time, so memory use does not
+    grow with the repository. "metadata" is written after "packages"
+    because package_count is only known once all keys have been seen.
+    
+    Returns the metadata with package_count filled in.
+    """
+    keys = iter(nevra_keys)
+    count = 0
+    
+    f.write(b'{\n  "packages": [' if indent else b'{"packages":[')
+    
+    while True:
+        chunk = list(itertools.islice(keys, JSON_CHUNK_SIZE))
+        if not chunk:
+            break
+        
+        if indent:
+            # Strip the brackets and indent the entries one more level
+            data = b'\n  ' + dump_json(chunk, indent=True)[2:-2].replace(b'\n', b'\n  ')
+        else:
+            data = dump_json(chunk)[1:-1]
+        
+        f.write(b',' + data if count else data)
+        count += len(chunk)
+    
+    metadata = dict(metadata, package_count=count)
+    if indent:
+        f.write(b'\n  ],\n  "metadata": ')
+        f.write(dump_json(metadata, indent=True).replace(b'\n', b'\n  '))
+        f.write(b'\n}\n')
+    else:
+        f.write(b'],"metadata":' + dump_json(metadata) + b'}')
+    
+    return metadata
+
+
+def write_sorted_text_index(f, nevra_keys, metadata):
+    """
+    Write a sorted-text index to the binary file `f`.
+    
+    The first line is "# " followed by the metadata as JSON; every other
+    line is one NEVRA key. Keys are deduplicated and sorted as UTF-8
+    bytes (the same order as sorting the str keys), which is the order
+    the reader's binary search over the raw file relies on.
+    
+    Returns the metadata with package_count filled in.
+    """
+    keys = sorted(set(nevra_keys))
+    metadata = dict(metadata, package_count=len(keys))
+    
+    f.write(b'# ' + dump_json(metadata) + b'\n')
+    f.writelines(key.encode('utf-8') + b'\n' for key in keys)
+    
+    return metadata
+
+
+def write_sqlite_index(path, nevra_keys, metadata):
+    """
+    Write an index as an SQLite database at `path`.
+    
+    Packages go into a WITHOUT ROWID table keyed on the five NEVRA
+    columns, so the primary key is the whole row and lookups need no
+    separate index. The repository id is stored once, in the metadata
+    table. Loaded in a single transaction with journaling and syncing
+    off: a failed build is discarded anyway.
+    
+    Returns the metadata with package_count filled in.
+    """
+    import sqlite3
+    
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("BEGIN")
+        conn.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value)")
+        conn.execute(
+            "CREATE TABLE packages ("
+            "name TEXT, epoch TEXT, version TEXT, release TEXT, arch TEXT, "
+            "PRIMARY KEY (name, epoch, version, release, arch)) WITHOUT ROWID")
+        
+        conn.executemany(
+            "INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?)",
+            (key.split('|') for key in nevra_keys))
+        
+        # rowcount would include replaced duplicates; count the rows stored
+        count = conn.execute("SELECT count(*) FROM packages").fetchone()[0]
+        metadata = dict(metadata, package_count=count)
+        conn.executemany("INSERT INTO metadata VALUES (?, ?)", metadata.items())
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
     
-    return output_path
+    return metadata
+
+
+def final_output_path(output_path, options):
+    """
+    Return `output_path` with the suffixes for the format and compression.
+    
+    Paths that already carry them are returned unchanged.
+    """
+    compress_suffix = ''
+    if options.compress:
+        compress_suffix = '.zst' if options.compress_format == 'zstd' else '.gz'
+        if output_path.endswith(compress_suffix):
+            output_path = output_path[:-len(compress_suffix)]
+    
+    if options.index_format != 'json':
+        # The reader picks the decoder from the file name
+        suffix = INDEX_FILE_SUFFIXES[options.index_format]
+        if not output_path.endswith(suffix):
+            if output_path.endswith('.json'):
+                output_path = output_path[:-len('.json')]
+            output_path += suffix
+    
+    return output_path + compress_suffix
+
+
+def read_index_metadata(path, options):
+    """
+    Return the metadata of the existing index at `path`, written with the
+    same format and compression `options`, or None if it cannot be read.
+    """
+    try:
+        if options.index_format == 'sqlite':
+            import sqlite3
+            uri = pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True)
+            try:
+                return dict(conn.execute("SELECT key, value FROM metadata"))
+            finally:
+                conn.close()
+        
+        with open(path, 'rb') as raw:
+            if options.compress and options.compress_format == 'zstd':
+                f = zstandard.ZstdDecompressor().stream_reader(raw)
+            elif options.compress:
+                f = gzip.GzipFile(fileobj=raw)
+            else:
+                f = contextlib.nullcontext(raw)
+            
+            with f as src:
+                if options.index_format == 'sorted-text':
+                    # Only the "# {metadata}" header line is needed
+                    return json.loads(src.readline()[2:])
+                content = src.read()
+        
+        if options.index_format == 'msgpack':
+            return msgpack.unpackb(content, raw=False)['metadata']
+        return json.loads(content)['metadata']
+    except Exception:
+        # A damaged or foreign file is simply rebuilt
+        return None
+
+
+def write_index(nevra_keys, metadata, output_path, options):
+    """
+    Write an index for the NEVRA keys to a JSON, MessagePack or
+    sorted-text file (optionally gzip or zstd compressed), or to an
+    SQLite database.
+    
+    `nevra_keys` is consumed as it is produced by the parser. The file is
+    written under a temporary name and only renamed into place once
+    complete, so a failed build never leaves a truncated index behind.
+    
+    package_count is the number of keys written. JSON and MessagePack are
+    streamed (or packed) as parsed and keep any duplicate keys; sorted-text
+    and SQLite hold or index every key anyway and store each NEVRA once.
+    
+    Returns a tuple: (final_path, metadata)
+    """
+    output_path = final_output_path(output_path, options)
+    zstd = options.compress and options.compress_format == 'zstd'
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    tmp_path = output_path + '.part'
+    
+    try:
+        if options.index_format == 'sqlite':
+            # A leftover from an interrupted run would be opened, not replaced
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            metadata = write_sqlite_index(tmp_path, nevra_keys, metadata)
+            os.replace(tmp_path, output_path)
+            return output_path, metadata
+        
+        with open(tmp_path, 'wb') as raw:
+            if zstd:
+                # Level 3 (the zstd default) compresses several times faster
+                # than higher levels at a similar ratio on index data;
+                # threads=-1: multi-threaded compression using all cores
+                cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+                f = cctx.stream_writer(raw, closefd=False)
+            elif options.compress:
+                f = gzip.GzipFile(os.path.basename(output_path), 'wb', fileobj=raw)
+            else:
+                f = contextlib.nullcontext(raw)
+            
+            with f as out:
+                if options.index_format == 'msgpack':
+                    # The columns need every key, so collect them first
+                    nevra_keys = list(nevra_keys)
+                    metadata = dict(metadata, package_count=len(nevra_keys))
+                    out.write(pack_index_soa(nevra_keys, metadata))
+                elif options.index_format == 'sorted-text':
+                    metadata = write_sorted_text_index(out, nevra_keys, metadata)
+                else:
+                    metadata = write_json_index(out, nevra_keys, metadata,
+                                                indent=not options.compress)
+        
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    
+    return output_path, metadata
 
 
 def main():
-    global SSL_CONTEXT
+    global SSL_CONTEXT, SESSION, CACHE_DIR
     
     args = parse_args()
     
@@ -523,7 +1761,33 @@ def main():
         SSL_CONTEXT.check_hostname = False
         SSL_CONTEXT.verify_mode = ssl.CERT_NONE
     
-    indexes = []
+    SESSION = make_session(args.insecure)
+    
+    if args.cache_dir:
+        CACHE_DIR = args.cache_dir
+    if args.no_cache:
+        CACHE_DIR = None
+    
+    if args.index_format == 'msgpack' and msgpack is None:
+        print("[!] --format msgpack requires the msgpack module")
+        print("    Install python3-msgpack or use --format json")
+        sys.exit(1)
+    
+    if args.index_format in ('sqlite', 'sorted-text') and args.compress:
+        print(f"[!] --format {args.index_format} indexes are queried in place "
+              "and cannot be compressed")
+        sys.exit(1)
+    
+    if args.compress_format is None:
+        args.compress_format = 'zstd' if zstandard is not None else 'gzip'
+    elif args.compress_format == 'zstd' and zstandard is None:
+        print("[!] --compress-format zstd requires the zstandard module")
+        print("    Install python3-zstandard or use --compress-format gzip")
+        sys.exit(1)
+    
+    options = BuildOptions(args.output, args.compress, args.compress_format,
+                           args.index_format, args.fast_regex)
+    results = []
     
     # === SOURCE: Local Cache ===
     if args.from_cache:
@@ -534,7 +1798,7 @@ def main():
         print(f"\n[*] Building indexes from local cache: {args.from_cache}")
         print("    (No network access required)")
         
-        indexes = build_index_from_cache(args.from_cache, args.verbose)
+        results = build_index_from_cache(args.from_cache, options, args.verbose)
     
     # === SOURCE: Direct URL ===
     elif args.baseurl:
@@ -548,14 +1812,14 @@ def main():
             print(f"[*] Using basearch: {args.basearch}")
         
         baseurl = substitute_variables(args.baseurl, args.releasever, args.basearch)
-        index = build_index_from_url(baseurl, args.repo_id, args.verbose)
-        if index:
-            indexes.append(index)
+        result = build_index_from_url(baseurl, args.repo_id, options, args.verbose)
+        if result:
+            results.append(result)
     
     # === SOURCE: .repo Config File ===
     elif args.repo_urls_from:
         if not os.path.exists(args.repo_urls_from):
-            print(f"[!] Repo file not found: {args.repo_urls_from}")
+            print(f"[!] Repo file or directory not found: {args.repo_urls_from}")
             sys.exit(1)
         
         print(f"\n[*] Parsing repo config: {args.repo_urls_from}")
@@ -568,45 +1832,42 @@ def main():
         
         repos = parse_repo_file(args.repo_urls_from)
         if not repos:
-            print("[!] No enabled repositories with baseurl found in .repo file")
+            print("[!] No enabled repositories with baseurl found in .repo file(s)")
             print("    Note: metalink/mirrorlist URLs are not supported.")
             sys.exit(1)
         
-        for repo_id, baseurl in repos.items():
-            baseurl = substitute_variables(baseurl, args.releasever, args.basearch)
-            if '$' in baseurl:
+        to_build = []
+        for repo_id, baseurls in repos.items():
+            baseurls = [substitute_variables(url, args.releasever, args.basearch)
+                        for url in baseurls]
+            unresolved = [url for url in baseurls if '$' in url]
+            if unresolved:
                 print(f"\n[!] WARNING: URL for {repo_id} contains unsubstituted variables:")
-                print(f"    {baseurl}")
+                for url in unresolved:
+                    print(f"    {url}")
                 print(f"    Use --releasever and/or --basearch to substitute them.")
                 continue
-            
-            index = build_index_from_url(baseurl, repo_id, args.verbose)
-            if index:
-                indexes.append(index)
+            to_build.append((repo_id, baseurls))
+        
+        if len(to_build) > 1 and not os.path.isdir(args.output):
+            print("[!] Several repositories found, --output must be a directory")
+            sys.exit(1)
+        
+        if to_build:
+            results = build_indexes_from_urls(to_build, options, args.verbose)
     
     else:
         print("[!] One of --baseurl, --repo-urls-from, or --from-cache is required")
         sys.exit(1)
     
-    # === Save Indexes ===
-    if not indexes:
+    # === Report Indexes ===
+    if not results:
         print("\n[!] No indexes were built")
         sys.exit(1)
     
-    for index in indexes:
-        repo_id = index['metadata']['repo_id']
-        
-        if os.path.isdir(args.output):
-            output_path = os.path.join(args.output, f"{repo_id}.json")
-        else:
-            output_path = args.output
-        
-        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
-        
-        final_path = save_index(index, output_path, args.compress)
-        
+    for final_path, metadata in results:
         print(f"\n[✓] Index saved: {final_path}")
-        print(f"    Packages indexed: {index['metadata']['package_count']}")
+        print(f"    Packages indexed: {metadata['package_count']}")
         
         size = os.path.getsize(final_path)
         if size > 1024 * 1024:
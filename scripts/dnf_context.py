@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+# Copyright (C) 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://www.gnu.org/licenses/>.
+
+"""
+Shared DNF Base loader
+
+print_repo_info.py and repo_discovery.py both need a DNF Base with the
+repositories read and the sack filled. fill_sack() is the expensive step
+(loading RPMDB + remote metadata), so the prepared Base is kept per process
+and handed to every caller that asks for the same cacheonly mode.
+
+Bases are closed once at interpreter exit rather than by each caller.
+"""
+
+import atexit
+import dnf
+
+# cacheonly -> prepared dnf.Base
+_bases = {}
+_filled = set()
+
+
+def get_base(cacheonly=False, fill_sack=True):
+    """
+    Return the shared DNF Base for the given cacheonly mode.
+
+    The first call creates the Base and reads all repositories. The sack is
+    filled on the first call with fill_sack=True, so a caller can inspect the
+    repository configuration before paying for the metadata load.
+    Exceptions from DNF are passed through to the caller.
+    """
+    base = _bases.get(cacheonly)
+    if base is None:
+        base = dnf.Base()
+        base.read_all_repos()
+        if cacheonly:
+            base.conf.cacheonly = True
+        _bases[cacheonly] = base
+
+    if fill_sack and cacheonly not in _filled:
+        base.fill_sack()
+        _filled.add(cacheonly)
+
+    return base
+
+
+@atexit.register
+def close():
+    """Close every Base handed out by get_base()."""
+    while _bases:
+        _, base = _bases.popitem()
+        base.close()
+    _filled.clear()
@@ -25,7 +25,9 @@ This is for educational purposes - to understand what files are needed and
 how to obtain them on a system without DNF installed.
 
 Requirements:
-    - Python 3 with standard library (requests is optional, uses urllib)
+    - Python 3 with standard library (requests is optional: when installed,
+      downloads share keep-alive connections and are retried; otherwise urllib;
+      lxml is optional and speeds up XML parsing)
     - Network access to repository mirrors
     - A .repo file or known repository URL
 
@@ -39,16 +41,66 @@ What this script does:
 
 import os
 import sys
+import shutil
+import threading
 import hashlib
 import gzip
-import xml.etree.ElementTree as ET
+import bz2
+import lzma
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from urllib.request import urlopen, Request
 from urllib.error import URLError, HTTPError
 from configparser import ConfigParser
 
+from thread_log import log, buffered_output
+
+# lxml is optional: libxml2 parses faster than ElementTree, and its
+# iterparse can report only the elements we look at
+try:
+    from lxml import etree as ET
+    HAVE_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    HAVE_LXML = False
+
+# requests is optional: when installed, one pooled session keeps HTTP
+# connections alive across downloads and retries transient failures
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    requests = None
+
+# zstandard is optional: only needed to inspect zstd-compressed primary
+# metadata (primary.xml.zst, the createrepo_c default on newer Fedora)
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# User-Agent sent with every request
+USER_AGENT = 'manual-metadata-download/1.0'
+
 # Namespace used in repomd.xml
 REPO_NS = {'repo': 'http://linux.duke.edu/metadata/repo'}
 
+# Bytes copied per read/write when saving a download to disk
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# repomd.xml checksum type names that hashlib knows under another name
+CHECKSUM_TYPE_ALIASES = {'sha': 'sha1'}
+
+# Maximum number of concurrent downloads (repositories and files together),
+# enforced by DOWNLOAD_SLOTS so mirrors are not flooded
+MAX_DOWNLOAD_WORKERS = 5
+DOWNLOAD_SLOTS = threading.Semaphore(MAX_DOWNLOAD_WORKERS)
+
+# Metadata types downloaded besides repomd.xml. repomd.xml also lists
+# filelists, other, updateinfo, modules, ...; for package-to-repo
+# discovery, primary is sufficient
+METADATA_TYPES = ('primary',)
 
 def parse_repo_file(repo_file_path):
     """
@@ -98,50 +150,203 @@ def resolve_baseurl(repo_info):
     return None
 
 
+@lru_cache(maxsize=None)
 def compute_cache_dir_hash(baseurl):
     """
     Compute the 16-character hash suffix for the cache directory.
     
+    SHA-256 is kept so the directory names follow DNF's scheme; results are
+    memoized per base URL.
+    
     NOTE: This is a simplified version. The actual libdnf hash computation
     may differ based on multiple factors (URL normalization, etc.).
     """
     return hashlib.sha256(baseurl.encode('utf-8')).hexdigest()[:16]
 
 
-def download_file(url, dest_path):
-    """Download a file from URL to destination path."""
-    print(f"  Downloading: {url}")
+class DownloadError(Exception):
+    """A download failed (HTTP error status or connection problem)."""
+
+
+def make_session():
+    """
+    Create the shared keep-alive requests session, or None without requests.
+    
+    Connection errors and 5xx answers are retried with a short backoff.
+    """
+    if requests is None:
+        return None
+    
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    # Files are saved exactly as served, as with urllib: the server must not
+    # wrap them in a transfer encoding that would end up on disk
+    session.headers.update({'User-Agent': USER_AGENT, 'Accept-Encoding': 'identity'})
+    return session
+
+
+# Shared HTTP session (None when requests is not installed)
+SESSION = make_session()
+
+
+def new_hasher(checksum_type):
+    """
+    Return a hashlib object for a repomd.xml checksum type (sha256, sha1,
+    ...), or None if hashlib does not support it.
+    """
+    try:
+        return hashlib.new(CHECKSUM_TYPE_ALIASES.get(checksum_type, checksum_type))
+    except (ValueError, TypeError):
+        return None
+
+
+def save_response(response, dest_path, checksum=None):
+    """
+    Copy a file-like response body to dest_path, DOWNLOAD_CHUNK_SIZE bytes
+    at a time, so memory use does not depend on the file size.
+    
+    `checksum` is an optional (checksum_type, hexdigest) pair. The data is
+    hashed as it is written, so verifying it needs no second read; a file
+    that does not match is removed.
+    
+    Returns the number of bytes written. Raises DownloadError on a
+    checksum mismatch.
+    """
+    hasher = new_hasher(checksum[0]) if checksum else None
+    
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    with open(dest_path, 'wb') as f:
+        if hasher is None:
+            shutil.copyfileobj(response, f, DOWNLOAD_CHUNK_SIZE)
+        else:
+            while True:
+                chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                f.write(chunk)
+        size = f.tell()
+    
+    if hasher is not None:
+        checksum_type, expected = checksum
+        actual = hasher.hexdigest()
+        if actual != expected.strip().lower():
+            os.remove(dest_path)
+            raise DownloadError(f"Checksum mismatch: expected {checksum_type} {expected}, got {actual}")
+    
+    return size
+
+
+def http_download(url, dest_path, checksum=None):
+    """
+    Download url to dest_path through SESSION, or urllib without requests.
     
-    req = Request(url, headers={'User-Agent': 'manual-metadata-download/1.0'})
+    `checksum` is passed on to save_response().
     
+    Returns the number of bytes written. Raises DownloadError.
+    """
+    with DOWNLOAD_SLOTS:
+        return _http_download(url, dest_path, checksum)
+
+
+def _http_download(url, dest_path, checksum):
+    if SESSION is not None:
+        try:
+            with SESSION.get(url, stream=True, timeout=30) as response:
+                if response.status_code >= 400:
+                    raise DownloadError(f"HTTP Error {response.status_code}: {response.reason}")
+                return save_response(response.raw, dest_path, checksum)
+        except requests.RequestException as e:
+            raise DownloadError(f"URL Error: {e}") from e
+    
+    req = Request(url, headers={'User-Agent': USER_AGENT})
     try:
         with urlopen(req, timeout=30) as response:
-            content = response.read()
-            
-            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
-            with open(dest_path, 'wb') as f:
-                f.write(content)
-            
-            print(f"  Saved to: {dest_path} ({len(content)} bytes)")
-            return content
+            return save_response(response, dest_path, checksum)
     except HTTPError as e:
-        print(f"  [!] HTTP Error {e.code}: {e.reason}")
-        return None
+        raise DownloadError(f"HTTP Error {e.code}: {e.reason}") from e
     except URLError as e:
-        print(f"  [!] URL Error: {e.reason}")
+        raise DownloadError(f"URL Error: {e.reason}") from e
+
+
+def download_file(url, dest_path):
+    """
+    Download a file from URL to destination path.
+    
+    Returns the number of bytes written, or None on failure.
+    """
+    log(f"  Downloading: {url}")
+    
+    try:
+        size = http_download(url, dest_path)
+    except DownloadError as e:
+        log(f"  [!] {e}")
         return None
+    
+    log(f"  Saved to: {dest_path} ({size} bytes)")
+    return size
+
+
+def download_files(files):
+    """
+    Download several (url, dest_path, checksum) entries concurrently.
+    
+    `checksum` is a (checksum_type, hexdigest) pair to verify the file
+    against while it is written, or None.
+    
+    Returns a list of byte counts (None for failed downloads), in `files`
+    order.
+    """
+    for url, _, _ in files:
+        log(f"  Downloading: {url}")
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_WORKERS, len(files))) as executor:
+        futures = [executor.submit(http_download, url, dest_path, checksum)
+                   for url, dest_path, checksum in files]
+    
+    sizes = []
+    for (url, dest_path, checksum), future in zip(files, futures):
+        try:
+            size = future.result()
+        except DownloadError as e:
+            log(f"  [!] {url}: {e}")
+            size = None
+        else:
+            verified = f", {checksum[0]} verified" if checksum else ""
+            log(f"  Saved to: {dest_path} ({size} bytes{verified})")
+        sizes.append(size)
+    
+    return sizes
 
 
-def parse_repomd(repomd_content):
+def parse_repomd(source):
     """
     Parse repomd.xml and extract metadata file locations.
     
+    `source` is a file path or a binary file-like object. The document is
+    parsed incrementally and each <data> element is cleared once read.
+    
     Returns a dict: {type: {'location': ..., 'checksum': ...}}
     """
-    root = ET.fromstring(repomd_content)
+    data_tag = f"{{{REPO_NS['repo']}}}data"
+    
+    if HAVE_LXML:
+        # repomd.xml comes from a remote mirror: never expand entities or
+        # fetch anything over the network
+        context = ET.iterparse(source, events=('end',), tag=data_tag,
+                               resolve_entities=False, no_network=True)
+    else:
+        context = ET.iterparse(source, events=('end',))
     
     metadata = {}
-    for data_elem in root.findall('repo:data', REPO_NS):
+    for _, data_elem in context:
+        if data_elem.tag != data_tag:
+            continue
+        
         data_type = data_elem.get('type')
         location = data_elem.find('repo:location', REPO_NS)
         checksum = data_elem.find('repo:checksum', REPO_NS)
@@ -152,82 +357,159 @@ def parse_repomd(repomd_content):
                 'checksum': checksum.text if checksum is not None else None,
                 'checksum_type': checksum.get('type') if checksum is not None else None,
             }
+        
+        data_elem.clear()
     
     return metadata
 
 
-def download_repo_metadata(repo_id, baseurl, output_dir):
+def open_compressed(path):
+    """Open a .gz, .xz, .bz2 or .zst metadata file for reading (binary)."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    elif path.endswith('.xz'):
+        return lzma.open(path, 'rb')
+    elif path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    elif path.endswith('.zst'):
+        if zstandard is None:
+            raise RuntimeError("the zstandard module is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+    raise ValueError(f"unknown compression: {path}")
+
+
+def download_repo_metadata(repo_id, baseurl, output_dir, types=None):
     """
     Download repository metadata to a directory structure matching DNF's cache.
     
+    `types` are the repomd.xml data types to fetch (default: METADATA_TYPES;
+    primary is required); once repomd.xml is parsed, they are downloaded
+    concurrently.
+    
     Creates: <output_dir>/<repo_id>-<hash>/repodata/
     """
-    print(f"\n[*] Downloading metadata for: {repo_id}")
-    print(f"    Base URL: {baseurl}")
+    log(f"\n[*] Downloading metadata for: {repo_id}")
+    log(f"    Base URL: {baseurl}")
     
     # Compute cache directory name (similar to DNF)
     hash_suffix = compute_cache_dir_hash(baseurl)
     cache_dir = os.path.join(output_dir, f"{repo_id}-{hash_suffix}")
     repodata_dir = os.path.join(cache_dir, "repodata")
     
-    print(f"    Cache dir: {cache_dir}")
+    log(f"    Cache dir: {cache_dir}")
     
     # Step 1: Download repomd.xml
     repomd_url = f"{baseurl.rstrip('/')}/repodata/repomd.xml"
     repomd_path = os.path.join(repodata_dir, "repomd.xml")
     
-    repomd_content = download_file(repomd_url, repomd_path)
-    if not repomd_content:
-        print(f"  [!] Failed to download repomd.xml")
+    if download_file(repomd_url, repomd_path) is None:
+        log(f"  [!] Failed to download repomd.xml")
         return False
     
     # Step 2: Parse repomd.xml to find primary metadata
-    print(f"\n[*] Parsing repomd.xml...")
-    metadata = parse_repomd(repomd_content)
+    # (streamed from the saved copy, which the cache directory needs anyway)
+    log(f"\n[*] Parsing repomd.xml...")
+    metadata = parse_repomd(repomd_path)
     
-    print(f"    Found metadata types: {list(metadata.keys())}")
+    log(f"    Found metadata types: {list(metadata.keys())}")
     
-    # Step 3: Download primary metadata (the package catalog)
+    # Step 3: Download primary metadata (the package catalog) and any other
+    # requested types (filelists, other, etc.) in parallel
     if 'primary' not in metadata:
-        print(f"  [!] No primary metadata found in repomd.xml")
+        log(f"  [!] No primary metadata found in repomd.xml")
         return False
     
-    primary_info = metadata['primary']
-    primary_url = f"{baseurl.rstrip('/')}/{primary_info['location']}"
-    primary_filename = os.path.basename(primary_info['location'])
-    primary_path = os.path.join(repodata_dir, primary_filename)
+    wanted = [t for t in types or METADATA_TYPES if t in metadata]
+    files = []
+    for t in wanted:
+        info = metadata[t]
+        
+        # Verify each file against its repomd.xml checksum while it is
+        # being saved
+        checksum = None
+        if info['checksum'] and info['checksum_type']:
+            if new_hasher(info['checksum_type']) is not None:
+                checksum = (info['checksum_type'], info['checksum'])
+            else:
+                log(f"  [!] Cannot verify {t}: unsupported checksum type {info['checksum_type']}")
+        
+        files.append((f"{baseurl.rstrip('/')}/{info['location']}",
+                      os.path.join(repodata_dir, os.path.basename(info['location'])),
+                      checksum))
+    
+    log(f"\n[*] Downloading {', '.join(wanted)} metadata...")
+    sizes = download_files(files)
     
-    print(f"\n[*] Downloading primary metadata...")
-    primary_content = download_file(primary_url, primary_path)
-    if not primary_content:
-        print(f"  [!] Failed to download primary metadata")
+    failed = [t for t, size in zip(wanted, sizes) if size is None]
+    if failed:
+        log(f"  [!] Failed to download {', '.join(failed)} metadata")
         return False
     
-    # Step 4: Optionally download other metadata (filelists, other, etc.)
-    # For package-to-repo discovery, primary is sufficient
+    primary_path = files[wanted.index('primary')][1]
+    primary_filename = os.path.basename(primary_path)
     
-    print(f"\n[✓] Successfully downloaded metadata for {repo_id}")
-    print(f"    Location: {repodata_dir}")
+    log(f"\n[✓] Successfully downloaded metadata for {repo_id}")
+    log(f"    Location: {repodata_dir}")
     
     # Show what's in the primary file
-    print(f"\n[*] Inspecting primary metadata...")
+    log(f"\n[*] Inspecting primary metadata...")
     try:
-        if primary_filename.endswith('.gz'):
-            with gzip.open(primary_path, 'rt', encoding='utf-8') as f:
-                # Just read first 1000 chars to show structure
-                sample = f.read(2000)
+        if primary_filename.endswith(('.xml.gz', '.xml.xz', '.xml.bz2', '.xml.zst')):
+            compression = primary_filename.rsplit('.', 1)[1]
+            with open_compressed(primary_path) as f:
+                # Just read first 2000 bytes to show structure
+                sample = f.read(2000).decode('utf-8', 'replace')
                 # Count packages (rough estimate)
                 pkg_count = sample.count('<package type="rpm"')
-                print(f"    Format: Gzipped XML")
-                print(f"    Sample packages found in first 2KB: {pkg_count}")
+                log(f"    Format: XML ({compression} compressed)")
+                log(f"    Sample packages found in first 2KB: {pkg_count}")
         elif primary_filename.endswith('.sqlite.bz2'):
-            print(f"    Format: SQLite (bz2 compressed)")
+            log(f"    Format: SQLite (bz2 compressed)")
     except Exception as e:
-        print(f"    Could not inspect: {e}")
+        log(f"    Could not inspect: {e}")
     
     return True
 
 
+def _download_repo_metadata_buffered(repo_id, baseurl, output_dir):
+    """
+    Run download_repo_metadata() with its output captured.
+    
+    Returns a tuple: (success, captured output)
+    """
+    with buffered_output() as output:
+        try:
+            success = download_repo_metadata(repo_id, baseurl, output_dir)
+        except Exception as e:
+            log(f"[!] Error downloading {repo_id}: {e}")
+            success = False
+        return success, output.getvalue()
+
+
+def download_repos_metadata(repos, output_dir):
+    """
+    Download metadata for several repositories concurrently.
+    
+    `repos` is a list of (repo_id, baseurl) tuples. Each repository's
+    output is buffered and printed as a whole as soon as it completes.
+    
+    Returns a dict: {repo_id: success}, in `repos` order.
+    """
+    results = {}
+    
+    with ThreadPoolExecutor(max_workers=min(MAX_DOWNLOAD_WORKERS, len(repos))) as executor:
+        futures = {
+            executor.submit(_download_repo_metadata_buffered, repo_id, baseurl, output_dir): repo_id
+            for repo_id, baseurl in repos
+        }
+        for future in as_completed(futures):
+            success, output = future.result()
+            print(output, end='')
+            results[futures[future]] = success
+    
+    return {repo_id: results[repo_id] for repo_id, _ in repos}
+
+
 def main():
     print("=" * 70)
     print("Manual Repository Metadata Download Demo")
@@ -268,23 +550,24 @@ def main():
         status = "enabled" if info['enabled'] else "disabled"
         print(f"    - {repo_id}: {info['name']} ({status})")
     
-    # Try to download metadata for the first enabled repo
+    # Download metadata for every enabled repo, several at a time
     output_dir = "/tmp/manual-dnf-cache"
     
+    to_download = []
     for repo_id, info in repos.items():
         if not info['enabled']:
             continue
         
         baseurl = resolve_baseurl(info)
         if baseurl:
-            success = download_repo_metadata(repo_id, baseurl, output_dir)
-            if success:
-                print(f"\n[*] You can now use this metadata with repo_discovery.py")
-                print(f"    by pointing DNF's cachedir to: {output_dir}")
-            break
+            to_download.append((repo_id, baseurl))
         else:
             print(f"\n[!] Could not resolve baseurl for {repo_id}")
             print(f"    This repo uses metalink/mirrorlist which requires additional parsing.")
+    
+    if to_download and any(download_repos_metadata(to_download, output_dir).values()):
+        print(f"\n[*] You can now use this metadata with repo_discovery.py")
+        print(f"    by pointing DNF's cachedir to: {output_dir}")
 
 
 if __name__ == "__main__":
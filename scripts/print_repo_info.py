@@ -14,20 +14,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <https://www.gnu.org/licenses/>.
 
-import dnf
+import dnf_context
 
 def print_all_package_repo_info():
-    # 1. Initialize DNF Base
-    base = dnf.Base()
-    
-    # 2. Load Configuration & Repositories
+    # 1-2. Initialize DNF Base & Load Configuration & Repositories
+    # The Base is shared with repo_discovery.py when both run in one process
     print("Loading configuration...")
-    base.read_all_repos()
+    base = dnf_context.get_base(fill_sack=False)
     
     # 3. Fill the Sack (Load RPMDB + Remote Metadata)
     # This is where the matching happens in memory
     print("Loading package metadata (this may take a moment)...")
-    base.fill_sack()
+    base = dnf_context.get_base()
     
     # 4. Query ALL installed packages
     query = base.sack.query().installed()
@@ -51,7 +49,6 @@ def print_all_package_repo_info():
         print(f"{pkg.name:<40} | {pkg.evr:<20} | {repo_display}")
 
     print("-" * 80)
-    base.close()
 
 if __name__ == "__main__":
     print_all_package_repo_info()
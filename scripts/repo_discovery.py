@@ -34,6 +34,7 @@ import sys
 import argparse
 import dnf
 import logging
+import dnf_context
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -52,25 +53,18 @@ def discover_package_origins(cacheonly=False):
     # Configure basic logging to suppress noisy internal DNF logs
     logging.basicConfig(level=logging.WARNING)
     
-    # 1. Initialize DNF Context
-    try:
-        base = dnf.Base()
-    except Exception as e:
-        print(f"Error: Failed to initialize DNF. Are you running with sufficient permissions?\nDetails: {e}")
-        sys.exit(1)
-
-    # 2. Load Configuration
+    # 1-2. Initialize DNF Context & Load Configuration
+    # The Base is shared with print_repo_info.py when both run in one process
     print("[*] Loading configuration...")
     try:
-        base.read_all_repos()
+        base = dnf_context.get_base(cacheonly=cacheonly, fill_sack=False)
     except Exception as e:
-        print(f"Error: Could not read repository configuration.\nDetails: {e}")
+        print(f"Error: Failed to initialize DNF or read repository configuration. "
+              f"Are you running with sufficient permissions?\nDetails: {e}")
         sys.exit(1)
 
-    # Apply cacheonly mode if requested
     if cacheonly:
         print("[*] Running in cache-only mode (no network access).")
-        base.conf.cacheonly = True
 
     # CHECK: Are there any enabled repositories?
     enabled_repos = list(base.repos.iter_enabled())
@@ -85,7 +79,7 @@ def discover_package_origins(cacheonly=False):
     # 3. Load Metadata (Fill the Sack)
     print("[*] Loading repository metadata...")
     try:
-        base.fill_sack()
+        base = dnf_context.get_base(cacheonly=cacheonly)
     except dnf.exceptions.RepoError as e:
         print(f"\n[!] ERROR: Failed to load repository metadata.")
         print(f"    Details: {e}")
@@ -99,7 +93,6 @@ def discover_package_origins(cacheonly=False):
 
     # 4. Build Index of Available Packages
     print("[*] Indexing available packages from remote repos...")
-    remote_index = {}
     
     # Iterate over all packages found in the remote repository metadata
     available_query = base.sack.query().available()
@@ -113,14 +106,13 @@ def discover_package_origins(cacheonly=False):
             print("    This is unusual. It might mean your repositories are empty or metadata is corrupt.")
             print("    Action: Try 'dnf clean all' followed by 'dnf makecache'.")
     
-    for pkg in available_query:
-        # Create a unique key: (Name, Epoch, Version, Release, Arch)
-        # We assume 0 for None epoch to match standard DNF behavior
-        epoch = pkg.epoch if pkg.epoch is not None else 0
-        nevra_key = (pkg.name, epoch, pkg.version, pkg.release, pkg.arch)
-        
-        # Map the unique key to the repository ID
-        remote_index[nevra_key] = pkg.reponame
+    # Map a unique key "name|epoch|version|release|arch" to the repository ID.
+    # This is the same key format build_offline_index.py writes.
+    # We assume 0 for None epoch to match standard DNF behavior
+    remote_index = {
+        f"{p.name}|{p.epoch or 0}|{p.version}|{p.release}|{p.arch}": p.reponame
+        for p in available_query.run()
+    }
 
     # 5. Cross-Reference Installed Packages
     print("[*] Cross-referencing installed packages against remote index...")
@@ -140,12 +132,11 @@ def discover_package_origins(cacheonly=False):
     match_count = 0
     miss_count = 0
 
-    for pkg in sorted(installed_query, key=lambda p: p.name):
-        epoch = pkg.epoch if pkg.epoch is not None else 0
-        key = (pkg.name, epoch, pkg.version, pkg.release, pkg.arch)
+    for pkg in sorted(installed_query.run(), key=lambda p: p.name):
+        key = f"{pkg.name}|{pkg.epoch or 0}|{pkg.version}|{pkg.release}|{pkg.arch}"
+        origin = remote_index.get(key)
         
-        if key in remote_index:
-            origin = remote_index[key]
+        if origin is not None:
             print(f"{pkg.name:<40} | {pkg.evr:<25} | {origin}")
             match_count += 1
         else:
@@ -166,8 +157,6 @@ def discover_package_origins(cacheonly=False):
         print("    - From a repository that is now disabled.")
         print("    - Obsolete versions no longer hosted on the mirror.")
 
-    base.close()
-
 if __name__ == "__main__":
     args = parse_args()
     discover_package_origins(cacheonly=args.cacheonly)
@@ -40,16 +40,74 @@ Usage:
 Dependencies:
     - Python 3 (standard library only - no DNF required!)
     - rpm command (to query installed packages)
+    - zstandard module (only for .zst compressed indexes)
+    - orjson module (optional, parses JSON indexes faster)
+    - isal module (optional, decompresses .gz indexes faster)
+    - msgpack module (only for .msgpack indexes)
+    - sqlite3 module (part of the standard library, for .sqlite indexes)
+
+.sqlite and sorted-text (.txt) indexes are queried in place: only the pages
+touched by each lookup are read, so startup time does not depend on the
+index size.
 """
 
 import os
 import sys
 import json
 import gzip
+import mmap
+import pathlib
+import sqlite3
 import argparse
+import itertools
 import subprocess
+from operator import attrgetter
+from collections import ChainMap, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+# orjson is optional: it parses large JSON indexes faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# isal is optional: its igzip decompresses .gz indexes faster than the
+# zlib-based gzip module
+try:
+    from isal import igzip as gzip_reader
+except ImportError:
+    gzip_reader = gzip
+
+# zstandard is optional: only needed to read .zst compressed indexes
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# msgpack is optional: only needed to read .msgpack indexes
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Leading bytes of zstd and gzip compressed files
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_MAGIC = b'\x1f\x8b'
+
+# One installed package and the repository it was matched to (None if
+# not found in any index)
+PackageResult = namedtuple(
+    'PackageResult', ['name', 'epoch', 'version', 'release', 'arch', 'nevra_key', 'repo'])
+
+# Recognized index file names (format + optional compression)
+INDEX_SUFFIXES = tuple(
+    f"{fmt}{comp}"
+    for fmt in ('.json', '.msgpack')
+    for comp in ('', '.gz', '.zst')
+) + ('.sqlite', '.txt')
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -105,28 +163,217 @@ Examples:
     return parser.parse_args()
 
 
-def load_index(index_path, verbose=False):
+class SqliteIndex(Mapping):
+    """
+    Read-only {nevra_key: repo_id} mapping backed by a .sqlite index.
+    
+    Nothing is loaded up front: each lookup is a primary key query.
+    """
+    
+    def __init__(self, path):
+        uri = pathlib.Path(path).resolve().as_uri() + '?mode=ro'
+        # Opened by a loader thread, queried from the main thread
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.metadata = dict(self.conn.execute("SELECT key, value FROM metadata"))
+        self.repo_id = self.metadata['repo_id']
+    
+    def get(self, nevra_key, default=None):
+        # A single query per lookup; __getitem__ and __contains__ use it
+        parts = nevra_key.split('|')
+        if len(parts) == 5:
+            row = self.conn.execute(
+                "SELECT 1 FROM packages WHERE name = ? AND epoch = ? "
+                "AND version = ? AND release = ? AND arch = ?", parts).fetchone()
+            if row is not None:
+                return self.repo_id
+        return default
+    
+    def __getitem__(self, nevra_key):
+        repo_id = self.get(nevra_key)
+        if repo_id is None:
+            raise KeyError(nevra_key)
+        return repo_id
+    
+    def __contains__(self, nevra_key):
+        return self.get(nevra_key) is not None
+    
+    def __iter__(self):
+        cursor = self.conn.execute(
+            "SELECT name, epoch, version, release, arch FROM packages")
+        return map('|'.join, cursor)
+    
+    def __len__(self):
+        return self.conn.execute("SELECT count(*) FROM packages").fetchone()[0]
+    
+    def __bool__(self):
+        # Without this, bool() would fall back to the count(*) scan
+        return self.conn.execute("SELECT 1 FROM packages LIMIT 1").fetchone() is not None
+
+
+class SortedTextIndex(Mapping):
+    """
+    Read-only {nevra_key: repo_id} mapping backed by a sorted-text index.
+    
+    The file is memory-mapped and each lookup is a binary search over its
+    bytes: O(log N) line reads, with nothing loaded up front.
+    """
+    
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        header_end = self.mm.find(b'\n')
+        if self.mm[:2] != b'# ' or header_end < 0:
+            raise ValueError("not a sorted-text index")
+        self.metadata = json.loads(self.mm[2:header_end])
+        self.repo_id = self.metadata['repo_id']
+        self.start = header_end + 1
+    
+    def get(self, nevra_key, default=None):
+        key = nevra_key.encode('utf-8')
+        mm = self.mm
+        # lo is always the start of a line; the key, if present, is on a
+        # line starting in [lo, hi)
+        lo, hi = self.start, len(mm)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mm.rfind(b'\n', lo, mid) + 1 or lo
+            end = mm.find(b'\n', start)
+            if end < 0:
+                end = len(mm)
+            
+            line = mm[start:end]
+            if line == key:
+                return self.repo_id
+            if line < key:
+                lo = end + 1
+            else:
+                hi = start
+        return default
+    
+    def __getitem__(self, nevra_key):
+        repo_id = self.get(nevra_key)
+        if repo_id is None:
+            raise KeyError(nevra_key)
+        return repo_id
+    
+    def __contains__(self, nevra_key):
+        return self.get(nevra_key) is not None
+    
+    def __iter__(self):
+        self.mm.seek(self.start)
+        return (line.rstrip(b'\n').decode('utf-8') for line in iter(self.mm.readline, b''))
+    
+    def __len__(self):
+        return self.metadata['package_count']
+    
+    def __bool__(self):
+        return self.start < len(self.mm)
+
+
+class IndexChain(ChainMap):
     """
-    Load a NEVRA index from a JSON file.
+    ChainMap over lazy indexes and the in-memory dict.
     
-    Returns: dict with 'metadata' and 'packages' keys
+    get() probes each mapping once; ChainMap.get would test membership in
+    every mapping and then look the key up again.
     """
-    if verbose:
-        print(f"    Loading: {index_path}")
     
+    def get(self, nevra_key, default=None):
+        for mapping in self.maps:
+            repo_id = mapping.get(nevra_key)
+            if repo_id is not None:
+                return repo_id
+        return default
+
+
+# Index types that are queried in place rather than loaded
+LAZY_INDEX_TYPES = {
+    '.sqlite': SqliteIndex,
+    '.txt': SortedTextIndex,
+}
+
+
+def unpack_index_soa(content):
+    """
+    Decode a MessagePack (struct-of-arrays) index into the JSON index layout.
+    """
+    raw = msgpack.unpackb(content, raw=False)
+    keys = map('|'.join, zip(raw['names'], raw['epochs'], raw['versions'],
+                             raw['releases'], raw['arches']))
+    return {'metadata': raw['metadata'], 'packages': list(keys)}
+
+
+def load_index(index_path):
+    """
+    Load a NEVRA index from a JSON or MessagePack file (optionally .gz or
+    .zst compressed), or open a .sqlite or sorted-text (.txt) index.
+    
+    Returns: dict with 'metadata' and 'packages' keys. 'packages' is a
+    list of NEVRA keys of the metadata's repo_id, a {nevra_key: repo_id}
+    dict (indexes written before the key list format) or, for .sqlite
+    and .txt, a SqliteIndex or SortedTextIndex.
+    """
+    lazy_type = LAZY_INDEX_TYPES.get(os.path.splitext(index_path)[1])
+    if lazy_type is not None:
+        try:
+            packages = lazy_type(index_path)
+        except (sqlite3.Error, OSError, ValueError, KeyError) as e:
+            print(f"[!] Failed to load index {index_path}: {e}")
+            return None
+        
+        return {'metadata': packages.metadata, 'packages': packages}
+    
+    base_path = index_path
+    if index_path.endswith('.gz'):
+        base_path = index_path[:-len('.gz')]
+    elif index_path.endswith('.zst'):
+        base_path = index_path[:-len('.zst')]
+    is_msgpack = base_path.endswith('.msgpack')
+    
+    if is_msgpack and msgpack is None:
+        print(f"[!] Cannot load {index_path}: the msgpack module is not installed")
+        print("    Install python3-msgpack or rebuild the index with --format json")
+        return None
+    
+    mapped = None
     try:
-        if index_path.endswith('.gz'):
-            with gzip.open(index_path, 'rt', encoding='utf-8') as f:
-                data = json.load(f)
-        else:
-            with open(index_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+        with open(index_path, 'rb') as raw:
+            # Detect the compression from the content, so renamed files
+            # still load
+            magic = raw.read(4)
+            raw.seek(0)
+            
+            if magic == ZSTD_MAGIC:
+                if zstandard is None:
+                    print(f"[!] Cannot load {index_path}: the zstandard module is not installed")
+                    print("    Install python3-zstandard or rebuild the index with --compress-format gzip")
+                    return None
+                with zstandard.ZstdDecompressor().stream_reader(raw) as f:
+                    content = f.read()
+            elif magic[:2] == GZIP_MAGIC:
+                with gzip_reader.GzipFile(fileobj=raw) as f:
+                    content = f.read()
+            elif (is_msgpack or orjson is not None) and os.fstat(raw.fileno()).st_size:
+                # Parse straight from the page cache instead of copying the
+                # whole file into a bytes object first. The json module
+                # needs bytes, and empty files cannot be mapped.
+                mapped = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+                content = memoryview(mapped)
+            else:
+                content = raw.read()
         
-        if verbose:
-            meta = data.get('metadata', {})
-            print(f"      Repo: {meta.get('repo_id', 'unknown')}")
-            print(f"      Packages: {meta.get('package_count', 'unknown')}")
-            print(f"      Generated: {meta.get('generated', 'unknown')}")
+        try:
+            if is_msgpack:
+                data = unpack_index_soa(content)
+            elif orjson is not None:
+                data = orjson.loads(content)
+            else:
+                data = json.loads(content)
+        finally:
+            if mapped is not None:
+                content.release()
+                mapped.close()
         
         return data
     
@@ -139,9 +386,18 @@ def load_all_indexes(index_files, index_dir, verbose=False):
     """
     Load all index files and merge them into a single lookup dict.
     
-    Returns: dict mapping nevra_key -> repo_id
+    .sqlite and sorted-text indexes are not loaded into a dict; they are
+    queried per lookup. Consecutive in-memory indexes are merged into one
+    dict, and the dicts and lazy indexes are chained in file order, so a
+    NEVRA found in several files resolves to the last one, as with
+    dict.update().
+    
+    Returns: mapping of nevra_key -> repo_id
     """
-    merged_packages = {}
+    # One entry per lazy index, one merged dict per run of in-memory
+    # indexes, in file order
+    mappings = []
+    lazy_indexes = []
     loaded_repos = []
     
     files_to_load = []
@@ -153,9 +409,12 @@ def load_all_indexes(index_files, index_dir, verbose=False):
     # Collect index files from --index-dir
     if index_dir:
         if os.path.isdir(index_dir):
-            for filename in os.listdir(index_dir):
-                if filename.endswith('.json') or filename.endswith('.json.gz'):
-                    files_to_load.append(os.path.join(index_dir, filename))
+            # DirEntry.is_file() uses the file type from the directory
+            # listing, so no stat() is needed per entry
+            with os.scandir(index_dir) as entries:
+                files_to_load.extend(
+                    entry.path for entry in entries
+                    if entry.name.endswith(INDEX_SUFFIXES) and entry.is_file())
     
     if not files_to_load:
         print("[!] No index files found")
@@ -163,13 +422,41 @@ def load_all_indexes(index_files, index_dir, verbose=False):
     
     print(f"[*] Loading {len(files_to_load)} index file(s)...")
     
-    for index_path in files_to_load:
-        data = load_index(index_path, verbose)
+    # File reads and decompression release the GIL, so loading the files in
+    # threads overlaps them with parsing. map() keeps the file order, which
+    # decides precedence below.
+    workers = min(len(files_to_load), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        loaded = list(executor.map(load_index, files_to_load))
+    
+    for index_path, data in zip(files_to_load, loaded):
+        if verbose:
+            print(f"    Loading: {index_path}")
+        
         if data:
             packages = data.get('packages', {})
-            merged_packages.update(packages)
-            
             meta = data.get('metadata', {})
+            
+            if verbose:
+                print(f"      Repo: {meta.get('repo_id', 'unknown')}")
+                print(f"      Packages: {meta.get('package_count', 'unknown')}")
+                print(f"      Generated: {meta.get('generated', 'unknown')}")
+            
+            if isinstance(packages, tuple(LAZY_INDEX_TYPES.values())):
+                lazy_indexes.append(packages)
+                mappings.append(packages)
+            else:
+                if not mappings or not isinstance(mappings[-1], dict):
+                    mappings.append({})
+                merged_packages = mappings[-1]
+                
+                if isinstance(packages, list):
+                    # Every key belongs to the index's repository
+                    repo_id = meta.get('repo_id', 'unknown')
+                    merged_packages.update(zip(packages, itertools.repeat(repo_id)))
+                else:
+                    merged_packages.update(packages)
+            
             loaded_repos.append({
                 'repo_id': meta.get('repo_id', 'unknown'),
                 'package_count': meta.get('package_count', 0),
@@ -177,9 +464,21 @@ def load_all_indexes(index_files, index_dir, verbose=False):
                 'file': index_path
             })
     
-    print(f"    Total packages in index: {len(merged_packages)}")
+    if not lazy_indexes:
+        merged_packages = mappings[0] if mappings else {}
+        print(f"    Total packages in index: {len(merged_packages)}")
+        return merged_packages, loaded_repos
+    
+    # Counting the union would read every lazy index entry; sum the metadata
+    # instead (NEVRAs present in several indexes are counted more than once)
+    total = sum(
+        len(mapping) if isinstance(mapping, dict)
+        else mapping.metadata.get('package_count', 0)
+        for mapping in mappings)
+    print(f"    Total packages in index: {total}")
     
-    return merged_packages, loaded_repos
+    # Later files take precedence, as with dict.update()
+    return IndexChain(*reversed(mappings)), loaded_repos
 
 
 def get_installed_packages_rpm():
@@ -188,7 +487,8 @@ def get_installed_packages_rpm():
     
     This does NOT require DNF - it directly queries the RPMDB.
     
-    Returns: list of dicts with keys: name, epoch, version, release, arch
+    Returns: list of dicts with keys: name, epoch, version, release, arch,
+    nevra_key
     """
     print("[*] Querying installed packages from RPMDB...")
     
@@ -196,150 +496,133 @@ def get_installed_packages_rpm():
     # %{EPOCH} returns (none) if not set, we need to handle that
     query_format = '%{NAME}|%{EPOCH}|%{VERSION}|%{RELEASE}|%{ARCH}\n'
     
+    # Read the output as rpm produces it rather than buffering all of it
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             ['rpm', '-qa', '--queryformat', query_format],
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
             text=True,
-            check=True
+            bufsize=1 << 20
         )
-    except subprocess.CalledProcessError as e:
-        print(f"[!] rpm command failed: {e}")
-        return None
     except FileNotFoundError:
         print("[!] rpm command not found. Is this an RPM-based system?")
         return None
     
     packages = []
-    for line in result.stdout.strip().split('\n'):
-        if not line:
-            continue
-        
-        parts = line.split('|')
-        if len(parts) != 5:
-            continue
-        
-        name, epoch, version, release, arch = parts
-        
-        # Handle (none) epoch
-        if epoch == '(none)':
-            epoch = '0'
-        
-        packages.append({
-            'name': name,
-            'epoch': epoch,
-            'version': version,
-            'release': release,
-            'arch': arch
-        })
+    with proc:
+        for line in proc.stdout:
+            # The query line is already the NEVRA index key once the (none)
+            # epoch is normalized
+            line = line.rstrip('\n').replace('|(none)|', '|0|')
+            
+            parts = line.split('|')
+            if len(parts) != 5:
+                continue
+            
+            name, epoch, version, release, arch = parts
+            
+            # Epochs and arches take only a handful of distinct values
+            packages.append({
+                'name': name,
+                'epoch': sys.intern(epoch),
+                'version': version,
+                'release': release,
+                'arch': sys.intern(arch),
+                'nevra_key': line
+            })
+    
+    if proc.returncode:
+        print(f"[!] rpm command failed: exit status {proc.returncode}")
+        return None
     
     print(f"    Found {len(packages)} installed packages")
     return packages
 
 
-def make_nevra_key(pkg):
-    """Create a NEVRA key string from a package dict."""
-    return f"{pkg['name']}|{pkg['epoch']}|{pkg['version']}|{pkg['release']}|{pkg['arch']}"
-
-
 def discover_origins(installed_packages, package_index):
     """
     Cross-reference installed packages against the index.
     
-    Returns: list of dicts with package info + discovered repo
+    Returns: list of PackageResult (package info + discovered repo)
     """
     print("[*] Cross-referencing packages against index...")
     
-    results = []
-    match_count = 0
-    miss_count = 0
+    # Probe every key in one map() call: with a plain dict index the loop
+    # runs in C; None marks packages no index knows about
+    keys = [pkg['nevra_key'] for pkg in installed_packages]
+    repos = list(map(package_index.get, keys))
+    match_count = len(repos) - repos.count(None)
     
-    for pkg in installed_packages:
-        nevra_key = make_nevra_key(pkg)
-        
-        if nevra_key in package_index:
-            repo = package_index[nevra_key]
-            match_count += 1
-        else:
-            repo = None
-            miss_count += 1
-        
-        results.append({
-            'name': pkg['name'],
-            'epoch': pkg['epoch'],
-            'version': pkg['version'],
-            'release': pkg['release'],
-            'arch': pkg['arch'],
-            'nevra_key': nevra_key,
-            'repo': repo
-        })
+    results = [
+        PackageResult(pkg['name'], pkg['epoch'], pkg['version'], pkg['release'],
+                      pkg['arch'], nevra_key, repo)
+        for pkg, nevra_key, repo in zip(installed_packages, keys, repos)
+    ]
     
     print(f"    Matched: {match_count}")
-    print(f"    Unmatched: {miss_count}")
+    print(f"    Unmatched: {len(results) - match_count}")
     
     return results
 
 
-def format_evr(epoch, version, release):
-    """Format epoch:version-release string."""
-    if epoch and epoch != '0':
-        return f"{epoch}:{version}-{release}"
-    return f"{version}-{release}"
+def filter_results(results, unmatched_only=False, matched_only=False):
+    """Return the results selected by --unmatched-only / --matched-only."""
+    if unmatched_only:
+        results = [pkg for pkg in results if pkg.repo is None]
+    if matched_only:
+        results = [pkg for pkg in results if pkg.repo is not None]
+    return results
 
 
 def output_table(results, unmatched_only=False, matched_only=False):
     """Output results as a formatted table."""
     header = f"{'Package Name':<40} | {'Version':<25} | {'Repository'}"
-    print("\n" + "-" * len(header))
-    print(header)
-    print("-" * len(header))
+    separator = "-" * len(header)
     
-    for pkg in sorted(results, key=lambda p: p['name']):
-        repo = pkg['repo']
-        
-        # Filter based on flags
-        if unmatched_only and repo is not None:
-            continue
-        if matched_only and repo is None:
-            continue
+    # Collect the rows and write them at once rather than print() per line
+    lines = ["", separator, header, separator]
+    
+    # Filter first so only the selected rows are sorted
+    selected = filter_results(results, unmatched_only, matched_only)
+    
+    for pkg in sorted(selected, key=attrgetter('name')):
+        repo = pkg.repo
         
-        evr = format_evr(pkg['epoch'], pkg['version'], pkg['release'])
+        # [epoch:]version-release, the epoch shown only when set
+        epoch = pkg.epoch
+        if epoch in ('0', ''):
+            evr = f"{pkg.version}-{pkg.release}"
+        else:
+            evr = f"{epoch}:{pkg.version}-{pkg.release}"
         repo_display = repo if repo else "(No match)"
         
-        print(f"{pkg['name']:<40} | {evr:<25} | {repo_display}")
+        lines.append(f"{pkg.name:<40} | {evr:<25} | {repo_display}")
     
-    print("-" * len(header))
+    lines.append(separator)
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def output_csv(results, unmatched_only=False, matched_only=False):
     """Output results as CSV."""
-    print("name,epoch,version,release,arch,repository")
+    lines = ["name,epoch,version,release,arch,repository"]
     
-    for pkg in sorted(results, key=lambda p: p['name']):
-        repo = pkg['repo']
-        
-        if unmatched_only and repo is not None:
-            continue
-        if matched_only and repo is None:
-            continue
+    # Filter first so only the selected rows are sorted
+    selected = filter_results(results, unmatched_only, matched_only)
+    
+    for pkg in sorted(selected, key=attrgetter('name')):
+        repo = pkg.repo
         
         repo_str = repo if repo else ""
-        print(f"{pkg['name']},{pkg['epoch']},{pkg['version']},{pkg['release']},{pkg['arch']},{repo_str}")
+        lines.append(f"{pkg.name},{pkg.epoch},{pkg.version},{pkg.release},{pkg.arch},{repo_str}")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
 def output_json(results, unmatched_only=False, matched_only=False):
     """Output results as JSON."""
-    filtered = []
-    
-    for pkg in results:
-        repo = pkg['repo']
-        
-        if unmatched_only and repo is not None:
-            continue
-        if matched_only and repo is None:
-            continue
-        
-        filtered.append(pkg)
+    filtered = [pkg._asdict()
+                for pkg in filter_results(results, unmatched_only, matched_only)]
     
     print(json.dumps(filtered, indent=2))
 
@@ -365,7 +648,9 @@ def main():
         args.index, args.index_dir, args.verbose
     )
     
-    if not package_index:
+    # Check the loaded files rather than the mapping, which would have to
+    # query the lazy indexes
+    if not loaded_repos:
         print("[!] No packages loaded from indexes")
         sys.exit(1)
     
@@ -396,7 +681,7 @@ def main():
         output_json(results, args.unmatched_only, args.matched_only)
     
     # Summary
-    matched = sum(1 for r in results if r['repo'] is not None)
+    matched = sum(1 for r in results if r.repo is not None)
     total = len(results)
     
     print(f"\nSummary:")
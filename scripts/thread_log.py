@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+# Copyright (C) 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://www.gnu.org/licenses/>.
+
+"""
+Per-thread buffered logging
+
+build_offline_index.py and manual_metadata_download.py process several
+repositories concurrently. Each worker thread logs into its own buffer,
+which the caller prints in one piece when that repository is done, so
+the output of different repositories never interleaves.
+"""
+
+import io
+import contextlib
+import threading
+
+# Per-thread output buffer used by log()
+_thread_output = threading.local()
+
+
+def log(*args, **kwargs):
+    """print() that honours the calling thread's output buffer, if any."""
+    print(*args, file=getattr(_thread_output, 'buffer', None), **kwargs)
+
+
+@contextlib.contextmanager
+def buffered_output():
+    """
+    Capture the calling thread's log() output for the duration of the
+    block. Yields the io.StringIO buffer collecting it.
+    """
+    _thread_output.buffer = io.StringIO()
+    try:
+        yield _thread_output.buffer
+    finally:
+        _thread_output.buffer = None
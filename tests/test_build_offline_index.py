@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+# Copyright (C) 2025
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <https://www.gnu.org/licenses/>.
+
+"""
+Tests for build_offline_index.py
+
+Run with: python3 -m unittest discover -s tests
+"""
+
+import io
+import os
+import sys
+import json
+import tempfile
+import unittest
+import contextlib
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import build_offline_index
+import repo_discovery_offline
+from build_offline_index import BuildOptions
+
+# NEVRA keys used by the index tests. "foo|0|1.0|1|x86_64" is a prefix
+# of the key after it, and "foo-libs" sorts between "foo|" keys and the
+# rest only as bytes ('-' < '|').
+NEVRA_KEYS = [
+    'bash|0|5.1.8|6.el9|x86_64',
+    'foo|0|1.0|1|x86_64',
+    'foo|0|1.0|1|x86_64x',
+    'foo-libs|0|1.0|1|x86_64',
+    'glibc|0|2.34|60.el9|i686',
+    'glibc|0|2.34|60.el9|x86_64',
+    'zlib|0|1.2.11|40.el9|x86_64',
+]
+
+PRIMARY_PACKAGE = """\
+<package type="rpm">
+  <name>{name}</name>
+  <arch>{arch}</arch>
+  <version epoch="{epoch}" ver="{version}" rel="{release}"/>
+  <checksum type="sha256" pkgid="YES">0123</checksum>
+  <summary>Test package</summary>
+</package>
+"""
+
+
+def make_primary_xml(keys, extra=''):
+    """primary.xml bytes with a createrepo-style <package> per NEVRA key."""
+    packages = ''.join(
+        PRIMARY_PACKAGE.format(name=name, epoch=epoch, version=version,
+                               release=release, arch=arch)
+        for name, epoch, version, release, arch in (key.split('|') for key in keys))
+    count = len(keys) + extra.count('<package ')
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<metadata xmlns="http://linux.duke.edu/metadata/common" '
+        'xmlns:rpm="http://linux.duke.edu/metadata/rpm" '
+        f'packages="{count}">\n{packages}{extra}</metadata>\n').encode('utf-8')
+
+
+class ParseRepoFileTest(unittest.TestCase):
+    """parse_repo_file() on .repo file contents."""
+
+    def parse(self, content):
+        with tempfile.NamedTemporaryFile('w', suffix='.repo', delete=False) as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return build_offline_index.parse_repo_file(f.name)
+
+    def test_sections(self):
+        repos = self.parse(
+            "[baseos]\n"
+            "name=Base\n"
+            "baseurl=http://mirror-a/baseos/\n"
+            "  http://mirror-b/baseos/\n"
+            "enabled=1\n"
+            "\n"
+            "[disabled]\n"
+            "baseurl=http://mirror-a/disabled/\n"
+            "enabled = 0\n")
+        self.assertEqual(repos, {
+            'baseos': ['http://mirror-a/baseos/', 'http://mirror-b/baseos/'],
+        })
+
+    def test_header_with_trailing_comment(self):
+        repos = self.parse(
+            "[baseos]\n"
+            "baseurl=http://mirror/baseos/\n"
+            "\n"
+            "[updates] # comment\n"
+            "baseurl=http://mirror/updates/\n"
+            "enabled=1\n"
+            "\n"
+            "[extras]  ; disabled for now\n"
+            "baseurl=http://mirror/extras/\n"
+            "enabled=0\n")
+        self.assertEqual(repos, {
+            'baseos': ['http://mirror/baseos/'],
+            'updates': ['http://mirror/updates/'],
+        })
+
+
+class SortedTextIndexTest(unittest.TestCase):
+    """SortedTextIndex lookups (binary search over the file bytes)."""
+    
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'test.txt')
+        with open(path, 'wb') as f:
+            # Unsorted, with a duplicate: the writer sorts and deduplicates
+            build_offline_index.write_sorted_text_index(
+                f, NEVRA_KEYS[::-1] + NEVRA_KEYS[:1], {'repo_id': 'test'})
+        self.index = repo_discovery_offline.SortedTextIndex(path)
+        self.addCleanup(self.index.mm.close)
+    
+    def test_every_key(self):
+        for key in NEVRA_KEYS:
+            self.assertEqual(self.index.get(key), 'test', key)
+    
+    def test_first_and_last_key(self):
+        keys = sorted(key.encode('utf-8') for key in NEVRA_KEYS)
+        self.assertEqual(self.index.get(keys[0].decode('utf-8')), 'test')
+        self.assertEqual(self.index.get(keys[-1].decode('utf-8')), 'test')
+    
+    def test_missing_key(self):
+        for key in ('aaa|0|1|1|noarch', 'zzz|0|1|1|noarch', 'foo|0|1.0|1|x86',
+                    'foo|0|1.0|1|x86_64y', 'glibc|0|2.34|60.el9|', ''):
+            self.assertIsNone(self.index.get(key), key)
+            self.assertEqual(self.index.get(key, 'default'), 'default')
+            self.assertNotIn(key, self.index)
+    
+    def test_duplicate_prefix(self):
+        self.assertIn('foo|0|1.0|1|x86_64', self.index)
+        self.assertIn('foo|0|1.0|1|x86_64x', self.index)
+        self.assertEqual(self.index['foo-libs|0|1.0|1|x86_64'], 'test')
+        with self.assertRaises(KeyError):
+            self.index['foo|0|1.0|1|x86_6']
+    
+    def test_iter_and_len(self):
+        self.assertEqual(list(self.index), sorted(NEVRA_KEYS, key=str.encode))
+        self.assertEqual(len(self.index), len(NEVRA_KEYS))
+        self.assertTrue(self.index)
+    
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'empty.txt')
+            with open(path, 'wb') as f:
+                build_offline_index.write_sorted_text_index(f, [], {'repo_id': 'empty'})
+            index = repo_discovery_offline.SortedTextIndex(path)
+            try:
+                self.assertFalse(index)
+                self.assertIsNone(index.get(NEVRA_KEYS[0]))
+            finally:
+                index.mm.close()
+
+
+class SqliteIndexTest(unittest.TestCase):
+    """SqliteIndex lookups."""
+    
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'test.sqlite')
+        metadata = build_offline_index.write_sqlite_index(
+            path, NEVRA_KEYS + NEVRA_KEYS[:1], {'repo_id': 'test'})
+        self.assertEqual(metadata['package_count'], len(NEVRA_KEYS))
+        self.index = repo_discovery_offline.SqliteIndex(path)
+        self.addCleanup(self.index.conn.close)
+    
+    def test_lookups(self):
+        for key in NEVRA_KEYS:
+            self.assertEqual(self.index.get(key), 'test', key)
+            self.assertEqual(self.index[key], 'test')
+            self.assertIn(key, self.index)
+    
+    def test_missing_key(self):
+        for key in ('aaa|0|1|1|noarch', 'foo|0|1.0|1|x86'):
+            self.assertIsNone(self.index.get(key))
+            self.assertNotIn(key, self.index)
+            with self.assertRaises(KeyError):
+                self.index[key]
+    
+    def test_malformed_key(self):
+        for key in ('', 'foo', 'foo|0|1.0|1', 'foo|0|1.0|1|x86_64|extra'):
+            self.assertEqual(self.index.get(key, 'default'), 'default')
+    
+    def test_iter_and_len(self):
+        self.assertEqual(sorted(self.index), sorted(NEVRA_KEYS))
+        self.assertEqual(len(self.index), len(NEVRA_KEYS))
+        self.assertTrue(self.index)
+        self.assertEqual(self.index.metadata['repo_id'], 'test')
+
+
+class WriteJsonIndexTest(unittest.TestCase):
+    """write_json_index() output is valid JSON holding the input."""
+    
+    def write(self, keys, indent):
+        f = io.BytesIO()
+        metadata = build_offline_index.write_json_index(
+            f, iter(keys), {'repo_id': 'test'}, indent=indent)
+        self.assertEqual(metadata, {'repo_id': 'test', 'package_count': len(keys)})
+        return json.loads(f.getvalue())
+    
+    def check(self, keys):
+        for indent in (False, True):
+            with self.subTest(count=len(keys), indent=indent):
+                self.assertEqual(self.write(keys, indent), {
+                    'packages': keys,
+                    'metadata': {'repo_id': 'test', 'package_count': len(keys)},
+                })
+    
+    def test_empty(self):
+        self.check([])
+    
+    def test_single_chunk(self):
+        self.check(NEVRA_KEYS)
+    
+    def test_several_chunks(self):
+        # Chunks of 3: several full chunks and a partial one
+        keys = [f'pkg{i}|0|1.0|1|x86_64' for i in range(10)]
+        with mock.patch.object(build_offline_index, 'JSON_CHUNK_SIZE', 3):
+            self.check(keys)
+            self.check(keys[:9])
+    
+    def test_escaped_keys(self):
+        self.check(['quote"|0|1|1|noarch', 'back\\slash|0|1|1|noarch', 'caf\u00e9|0|1|1|noarch'])
+
+
+class ParsePrimaryXmlRegexTest(unittest.TestCase):
+    """--fast-regex yields the same keys as the XML parser."""
+    
+    def assertSameKeys(self, data):
+        with contextlib.redirect_stdout(io.StringIO()):
+            fast = list(build_offline_index.parse_primary_xml_regex(io.BytesIO(data)))
+        self.assertEqual(fast, list(build_offline_index.parse_primary_xml(io.BytesIO(data))))
+        return fast
+    
+    def test_createrepo_layout(self):
+        self.assertEqual(self.assertSameKeys(make_primary_xml(NEVRA_KEYS)), NEVRA_KEYS)
+    
+    def test_entity_falls_back(self):
+        # Names with entities are not matched by the regex
+        data = make_primary_xml(NEVRA_KEYS[:2] + ['a&amp;b|0|1|1|noarch'])
+        self.assertIn('a&b|0|1|1|noarch', self.assertSameKeys(data))
+    
+    def test_different_layout_falls_back(self):
+        extra = ('<package type="rpm">\n  <arch>noarch</arch>\n  <name>reordered</name>\n'
+                 '  <version epoch="1" ver="2" rel="3"/>\n</package>\n')
+        keys = self.assertSameKeys(make_primary_xml(NEVRA_KEYS, extra))
+        self.assertEqual(keys, NEVRA_KEYS + ['reordered|1|2|3|noarch'])
+    
+    def test_truncated_falls_back(self):
+        # Fewer packages than the declared count
+        data = make_primary_xml(NEVRA_KEYS).replace(
+            f'packages="{len(NEVRA_KEYS)}"'.encode(), b'packages="100"')
+        self.assertEqual(self.assertSameKeys(data), NEVRA_KEYS)
+
+
+class IndexRoundTripTest(unittest.TestCase):
+    """write_index() output, for every --format, loads back with the reader."""
+    
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmpdir = tmpdir.name
+    
+    def build(self, repo_id, keys, index_format, compress=False, compress_format='gzip'):
+        options = BuildOptions(output=self.tmpdir, compress=compress,
+                               compress_format=compress_format,
+                               index_format=index_format, fast_regex=False)
+        path, metadata = build_offline_index.write_index(
+            iter(keys), {'repo_id': repo_id},
+            build_offline_index.output_path_for(options, repo_id), options)
+        self.assertEqual(metadata['package_count'], len(set(keys)))
+        self.assertEqual(build_offline_index.read_index_metadata(path, options), metadata)
+        return path
+    
+    def load(self, paths):
+        with contextlib.redirect_stdout(io.StringIO()):
+            mapping, loaded_repos = repo_discovery_offline.load_all_indexes(paths, None)
+        # Lazy indexes keep their file open
+        for index in getattr(mapping, 'maps', ()):
+            if isinstance(index, repo_discovery_offline.SqliteIndex):
+                self.addCleanup(index.conn.close)
+            elif isinstance(index, repo_discovery_offline.SortedTextIndex):
+                self.addCleanup(index.mm.close)
+        self.assertEqual(len(loaded_repos), len(paths))
+        return mapping
+    
+    def check_format(self, index_format, **kwargs):
+        path = self.build('test', NEVRA_KEYS, index_format, **kwargs)
+        mapping = self.load([path])
+        for key in NEVRA_KEYS:
+            self.assertEqual(mapping.get(key), 'test', key)
+        self.assertIsNone(mapping.get('missing|0|1|1|noarch'))
+    
+    def test_json(self):
+        self.check_format('json')
+    
+    def test_json_gzip(self):
+        self.check_format('json', compress=True)
+    
+    @unittest.skipIf(build_offline_index.zstandard is None, 'zstandard is not installed')
+    def test_json_zstd(self):
+        self.check_format('json', compress=True, compress_format='zstd')
+    
+    @unittest.skipIf(build_offline_index.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        self.check_format('msgpack')
+    
+    @unittest.skipIf(build_offline_index.msgpack is None, 'msgpack is not installed')
+    def test_msgpack_gzip(self):
+        self.check_format('msgpack', compress=True)
+    
+    def test_sqlite(self):
+        self.check_format('sqlite')
+    
+    def test_sorted_text(self):
+        self.check_format('sorted-text')
+    
+    def test_all_formats_together(self):
+        # The same NEVRA in every index resolves to the last file given
+        formats = ['sqlite', 'json', 'sorted-text']
+        if build_offline_index.msgpack is not None:
+            formats.insert(2, 'msgpack')
+        shared = 'shared|0|1|1|noarch'
+        paths = [
+            self.build(f'repo-{fmt}', [f'only-{fmt}|0|1|1|noarch', shared], fmt)
+            for fmt in formats]
+        
+        for order in (paths, paths[::-1]):
+            mapping = self.load(order)
+            for fmt in formats:
+                self.assertEqual(mapping.get(f'only-{fmt}|0|1|1|noarch'), f'repo-{fmt}')
+            last = os.path.basename(order[-1]).split('.')[0]
+            self.assertEqual(mapping.get(shared), last)
+
+
+if __name__ == '__main__':
+    unittest.main()